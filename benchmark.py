@@ -0,0 +1,451 @@
+import argparse
+import cProfile
+import json
+import math
+import os
+import pstats
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from price_service import PriceService
+from service_catalog import DEFAULT_SERVICES
+from storage import ID_COLUMN, ExcelBackend
+
+# Repeatable timings for the price list at scale. Synthetic Watch_Services
+# workbooks are saved once per size and seed the way the app saves them,
+# snapshot cache included, copied to a scratch directory for each run, then
+# loaded and edited through PriceService, or through WatchPricingApp itself
+# with every dialog answered automatically. --cold leaves the cache behind,
+# timing a full parse and the slower first save of a workbook from elsewhere.
+#
+#   python benchmark.py                           1k and 10k rows
+#   python benchmark.py --rows 100000 --ops 200
+#   xvfb-run python benchmark.py --gui            the Tk app on a virtual display
+#   python benchmark.py --profile save            cProfile of one stage
+#   python benchmark.py --tracemalloc             Python heap peak per stage
+#   python benchmark.py --save before.json
+#   python benchmark.py --compare before.json     exit code 1 on a slowdown
+
+STAGES = ["load", "check_duplicate", "add", "update", "remove", "save"]
+BRANDS = ["Seiko", "Citizen", "Casio", "Timex", "Tissot", "Hamilton", "Bulova", "Fossil", "Omega",
+          "Rolex", "Longines", "Swatch", "Orient", "Movado", "Rado", "Oris", "Breitling", "Tudor",
+          "Invicta", "Skagen", "Guess", "Michael Kors", "Raymond Weil", "Victorinox"]
+
+
+def synthetic_rows(count, seed=0):
+    # The same rows for the same count and seed, IDs included
+    rng = random.Random(seed)
+    services = list(DEFAULT_SERVICES.items())
+    start = datetime(2021, 1, 1)
+    for _ in range(count):
+        service_type, categories = rng.choice(services)
+        added = start + timedelta(minutes=rng.randrange(3 * 365 * 24 * 60))
+        yield [
+            f"{rng.choice(BRANDS)} {rng.randrange(1000, 10000)}",
+            round(rng.uniform(5, 400), 2),
+            rng.choice(categories),
+            service_type,
+            added.strftime("%Y-%m-%d %H:%M"),
+            uuid.UUID(int=rng.getrandbits(128)).hex,
+        ]
+
+
+def synthetic_workbook(directory, count, seed=0):
+    path = os.path.join(directory, f"synthetic-{count}-{seed}.xlsx")
+    if not os.path.exists(path) or not os.path.exists(path + ".cache"):
+        ExcelBackend(path).write([], list(synthetic_rows(count, seed)))
+    return path
+
+
+def percentile(samples, percent):
+    # Nearest rank
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def peak_rss_mb():
+    # Peak resident size of the whole process; not available on Windows
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+class Bench:
+    # Collects the samples of each stage; the profiler and tracemalloc are
+    # only switched on around the stage being looked at, so they do not
+    # distort the others. Saves happen on the store's writer thread, which
+    # gets a profiler of its own (see watch_writer).
+
+    def __init__(self, profile=None, trace_memory=False):
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.samples = {stage: [] for stage in STAGES}
+        self.peaks = {}  # stage -> traced Python heap peak in bytes
+        self.profilers = [cProfile.Profile(), cProfile.Profile()] if profile else []
+        self.current = None
+
+    def watch_writer(self, worker):
+        # Profiles the journal appends and writes the SaveWorker makes
+        # while the profiled stage is running
+        if not self.profilers:
+            return
+        writer_profiler = self.profilers[1]
+
+        def profiled(function):
+            def call(*args):
+                if self.current != self.profile:
+                    return function(*args)
+                return writer_profiler.runcall(function, *args)
+            return call
+
+        worker.write = profiled(worker.write)
+        if worker.log is not None:
+            worker.log = profiled(worker.log)
+
+    def stats(self):
+        stats = None
+        for profiler in self.profilers:
+            # A profiler that never ran has nothing to add
+            if profiler.getstats():
+                if stats is None:
+                    stats = pstats.Stats(profiler)
+                else:
+                    stats.add(profiler)
+        return stats
+
+    @contextmanager
+    def stage(self, name):
+        self.current = name
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profile == name:
+            self.profilers[0].enable()
+        try:
+            yield
+        finally:
+            self.current = None
+            if self.profile == name:
+                self.profilers[0].disable()
+            if self.trace_memory:
+                self.peaks[name] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+    @contextmanager
+    def timed(self, name):
+        start = time.perf_counter()
+        yield
+        self.samples[name].append(time.perf_counter() - start)
+
+    def results(self):
+        results = {}
+        for stage, samples in self.samples.items():
+            if not samples:
+                continue
+            results[stage] = {
+                "n": len(samples),
+                "p50": percentile(samples, 50) * 1000,
+                "p90": percentile(samples, 90) * 1000,
+                "p99": percentile(samples, 99) * 1000,
+                "max": max(samples) * 1000,
+            }
+            if stage in self.peaks:
+                results[stage]["peak_mb"] = self.peaks[stage] / (1024 * 1024)
+        return results
+
+
+class ServiceDriver:
+    # The operations as the command line runs them, without any UI
+
+    name = "service"
+
+    def open(self, path):
+        self.service = PriceService(path).open()
+        self.store = self.service.store
+
+    def check_duplicate(self, brand, service_type):
+        self.service.check_duplicate(brand, service_type)
+
+    def add(self, brand, price, category, service_type):
+        self.service.add(brand, price, category, service_type)
+
+    def update(self, record_id, price):
+        row = self.store.get(record_id)
+        self.service.update(record_id, row[0], price, row[2], row[3])
+
+    def remove(self, record_id):
+        self.service.remove(record_id)
+
+    def save(self):
+        self.store.flush()
+
+    def close(self):
+        self.service.close()
+
+
+class AutoDialogs:
+    # Stands in for the message boxes and file dialogs: opens `path`, says
+    # yes to every question and keeps the errors the app would have shown
+
+    def __init__(self, path):
+        self.path = path
+        self.errors = []
+
+    @contextmanager
+    def installed(self):
+        from tkinter import filedialog, messagebox
+        replaced = {
+            (messagebox, "askyesno"): lambda *args, **kwargs: True,
+            (messagebox, "showinfo"): lambda *args, **kwargs: "ok",
+            (messagebox, "showwarning"): self.error,
+            (messagebox, "showerror"): self.error,
+            (filedialog, "askopenfilename"): lambda *args, **kwargs: self.path,
+        }
+        originals = {key: getattr(*key) for key in replaced}
+        for (module, name), function in replaced.items():
+            setattr(module, name, function)
+        try:
+            yield self
+        finally:
+            for (module, name), function in originals.items():
+                setattr(module, name, function)
+
+    def error(self, title, message, **kwargs):
+        self.errors.append(f"{title}: {message}")
+        return "ok"
+
+
+class AppDriver:
+    # The same operations through WatchPricingApp's handlers, filling in the
+    # form like a user would. Needs a display (Xvfb is fine).
+
+    name = "gui"
+
+    def open(self, path):
+        import tkinter as tk
+        from watch_app import WatchPricingApp
+        self.dialogs = AutoDialogs(path)
+        self._dialogs = self.dialogs.installed()
+        self._dialogs.__enter__()
+        self.root = tk.Tk()
+        self.app = WatchPricingApp(self.root)
+        self.store = self.app.store
+        # Loading finishes when the Tk thread has shown the last batch
+        while self.app.load_frame.winfo_manager():
+            self.root.update()
+            time.sleep(0.001)
+        self.check_errors()
+
+    def check_errors(self):
+        if self.dialogs.errors:
+            raise RuntimeError(self.dialogs.errors[0])
+
+    def fill(self, brand, price, category=None, service_type=None):
+        app = self.app
+        for entry, value in ((app.brand_entry, brand), (app.price_entry, price)):
+            entry.delete(0, "end")
+            entry.insert(0, value)
+        if service_type is not None:
+            app.service_type.set(service_type)
+            app.update_categories(None)
+        if category is not None:
+            app.category_type.set(category)
+
+    def settle(self):
+        self.root.update_idletasks()
+        self.check_errors()
+
+    def check_duplicate(self, brand, service_type):
+        self.app.check_duplicate(brand, service_type)
+
+    def add(self, brand, price, category, service_type):
+        self.fill(brand, price, category, service_type)
+        self.app.add_entry()
+        self.settle()
+
+    def update(self, record_id, price):
+        self.app.on_select(record_id)
+        self.fill(self.app.brand_entry.get(), price)
+        self.app.update_entry()
+        self.settle()
+
+    def remove(self, record_id):
+        self.app.on_select(record_id)
+        self.app.remove_entry()
+        self.settle()
+
+    def save(self):
+        self.store.flush()
+
+    def close(self):
+        try:
+            self.app.on_close()
+        finally:
+            self._dialogs.__exit__(None, None, None)
+
+
+def run_size(driver, template, bench, ops, loads, seed, cold=False):
+    rng = random.Random(seed)
+    services = list(DEFAULT_SERVICES.items())
+    extension = os.path.splitext(template)[1]
+    for attempt in range(loads):
+        # A fresh copy each time, so no journal or history is left over
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "prices" + extension)
+            # Modification times are kept, so the copied cache still matches
+            shutil.copy2(template, path)
+            if not cold and os.path.exists(template + ".cache"):
+                shutil.copy2(template + ".cache", path + ".cache")
+            with bench.stage("load"):
+                with bench.timed("load"):
+                    driver.open(path)
+            if attempt < loads - 1:
+                driver.close()
+                continue
+
+            bench.watch_writer(driver.store._worker)
+            rows = driver.store.rows
+            ops = min(ops, len(rows) // 2)
+            picked = rng.sample([row[ID_COLUMN] for row in rows], 2 * ops)
+            updates, removes = picked[:ops], picked[ops:]
+            # Half the lookups find an entry, half do not
+            lookups = [(row[0], row[3]) for row in rng.sample(rows, ops - ops // 2)]
+            lookups += [(f"Missing {i}", rng.choice(services)[0]) for i in range(ops // 2)]
+            try:
+                with bench.stage("check_duplicate"):
+                    for brand, service_type in lookups:
+                        with bench.timed("check_duplicate"):
+                            driver.check_duplicate(brand, service_type)
+                with bench.stage("add"):
+                    for i in range(ops):
+                        service_type, categories = rng.choice(services)
+                        price = f"{rng.uniform(5, 400):.2f}"
+                        with bench.timed("add"):
+                            driver.add(f"Bench {i}", price, rng.choice(categories), service_type)
+                with bench.stage("update"):
+                    for record_id in updates:
+                        price = f"{rng.uniform(5, 400):.2f}"
+                        with bench.timed("update"):
+                            driver.update(record_id, price)
+                with bench.stage("remove"):
+                    for record_id in removes:
+                        with bench.timed("remove"):
+                            driver.remove(record_id)
+                # Everything above written out in one go, workbook included
+                with bench.stage("save"):
+                    with bench.timed("save"):
+                        driver.save()
+            finally:
+                driver.close()
+
+
+def print_results(title, results):
+    print(title)
+    print(f"  {'stage':<16}{'n':>6}{'p50 ms':>11}{'p90 ms':>11}{'p99 ms':>11}{'max ms':>11}{'peak MB':>10}")
+    for stage, result in results.items():
+        peak = f"{result['peak_mb']:.1f}" if "peak_mb" in result else ""
+        print(f"  {stage:<16}{result['n']:>6}{result['p50']:>11.3f}{result['p90']:>11.3f}"
+              f"{result['p99']:>11.3f}{result['max']:>11.3f}{peak:>10}")
+
+
+def compare(results, baseline, tolerance):
+    # Stages whose median got slower than baseline * tolerance
+    slower = []
+    for key, stages in results.items():
+        for stage, result in stages.items():
+            before = baseline.get(key, {}).get(stage)
+            if before and result["p50"] > before["p50"] * tolerance:
+                slower.append(f"{key} {stage}: p50 {before['p50']:.3f} ms -> {result['p50']:.3f} ms")
+    return slower
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Time loading and editing large synthetic price lists")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000],
+                        help="workbook sizes (default 1000 10000)")
+    parser.add_argument("--ops", type=int, default=500, help="samples per edit stage (default 500)")
+    parser.add_argument("--loads", type=int, default=3, help="times each workbook is loaded (default 3)")
+    parser.add_argument("--format", choices=["xlsx", "db"], default="xlsx", help="storage backend")
+    parser.add_argument("--gui", action="store_true", help="drive WatchPricingApp instead of PriceService")
+    parser.add_argument("--cold", action="store_true", help="open the workbooks without their snapshot cache")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="where generated workbooks are kept between runs")
+    parser.add_argument("--profile", choices=STAGES, help="cProfile this stage")
+    parser.add_argument("--profile-out", help="write the profile here (for snakeviz etc.) instead of printing it")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="report the Python heap peak per stage (timings get slower)")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file from --save to check the results against")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="allowed p50 slowdown factor for --compare (default 1.5)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    workdir = args.workdir or os.path.join(tempfile.gettempdir(), "watch-benchmark")
+    os.makedirs(workdir, exist_ok=True)
+    driver = AppDriver() if args.gui else ServiceDriver()
+    if args.gui:
+        import tkinter as tk
+        try:
+            tk.Tk().destroy()
+        except tk.TclError as e:
+            print(f"error: --gui needs a display, e.g. run under xvfb-run ({e})", file=sys.stderr)
+            return 2
+
+    results = {}
+    profiler = None
+    for count in args.rows:
+        template = synthetic_workbook(workdir, count, args.seed)
+        if args.format == "db":
+            # A new database imports the workbook of the same name
+            database = os.path.splitext(template)[0] + ".db"
+            if not os.path.exists(database):
+                PriceService(database).open().close()
+            template = database
+        bench = Bench(profile=args.profile, trace_memory=args.tracemalloc)
+        run_size(driver, template, bench, args.ops, args.loads, args.seed, args.cold)
+        key = f"{count} rows {args.format} {driver.name}" + (" cold" if args.cold else "")
+        results[key] = bench.results()
+        print_results(key, results[key])
+        stats = bench.stats()
+        if stats is not None:
+            if profiler is None:
+                profiler = stats
+            else:
+                profiler.add(stats)
+
+    rss = peak_rss_mb()
+    if rss is not None:
+        print(f"Peak process memory: {rss:.1f} MB")
+    if profiler is not None:
+        if args.profile_out:
+            profiler.dump_stats(args.profile_out)
+        else:
+            profiler.sort_stats("cumulative").print_stats(25)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            slower = compare(results, json.load(f), args.tolerance)
+        for line in slower:
+            print(f"slower: {line}", file=sys.stderr)
+        if slower:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,19 @@
+import argparse
+
 import PyInstaller.__main__
 
+# python build.py            one WatchBatteryPricing.exe, unpacked to a temp
+#                            folder every time it starts
+# python build.py --onedir   dist/WatchBatteryPricing/ with the exe next to
+#                            its libraries; starts faster, ship the folder
+parser = argparse.ArgumentParser(description="Build the WatchBatteryPricing executable")
+parser.add_argument("--onedir", action="store_true", help="build a folder instead of a single file")
+args = parser.parse_args()
+
 PyInstaller.__main__.run([
     'watch_app.py',
-    '--onefile',
+    '--onedir' if args.onedir else '--onefile',
     '--windowed',
     '--name=WatchBatteryPricing',
     '--noconsole',
-])
\ No newline at end of file
+])
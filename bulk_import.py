@@ -0,0 +1,125 @@
+import csv
+from datetime import datetime
+
+from price_store import validate_entry
+from storage import duplicate_key, read_workbook
+
+# Header names accepted for each column, in the Watch_Services order
+COLUMN_NAMES = (
+    ("brand",),
+    ("price", "price ($)"),
+    ("category",),
+    ("service type", "service"),
+    ("date added", "date"),
+)
+
+
+def read_price_list(path):
+    # Streams (line number, row) from a CSV or XLSX price list
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            for number, row in enumerate(csv.reader(f), start=1):
+                yield number, row
+    else:
+        _, _, rows = read_workbook(path)
+        for number, row in enumerate(rows, start=1):
+            yield number, row
+
+
+def header_columns(row):
+    # Column positions if row is a header row, otherwise None
+    names = [str(cell).strip().lower() if cell is not None else "" for cell in row]
+    if "brand" not in names:
+        return None
+    columns = []
+    for aliases in COLUMN_NAMES:
+        columns.append(next((names.index(alias) for alias in aliases if alias in names), None))
+    return columns
+
+
+class ImportPlan:
+    def __init__(self):
+        self.inserts = []    # values for new rows
+        self.conflicts = []  # (existing record ID, values) for brand/service pairs already listed
+        self.rejects = []    # (line number, reason)
+
+    def summary(self, limit=10):
+        lines = [
+            f"{len(self.inserts)} new entries",
+            f"{len(self.conflicts)} already in the price list",
+            f"{len(self.rejects)} rejected",
+        ]
+        for number, reason in self.rejects[:limit]:
+            lines.append(f"  Line {number}: {reason}")
+        if len(self.rejects) > limit:
+            lines.append(f"  ...and {len(self.rejects) - limit} more")
+        return "\n".join(lines)
+
+
+def plan_import(store, path, batch_size=1000):
+    # Validates the file in batches with the same rules as the entry form
+    # and sorts every row into inserts, conflicts with existing entries, or
+    # rejects, in one pass over the file and the duplicate index
+    plan = ImportPlan()
+    seen = {}  # duplicate key -> line number of its first row in this file
+    columns = list(range(len(COLUMN_NAMES)))
+    batch = []
+    first_row = True
+    for number, row in read_price_list(path):
+        if not any(cell not in (None, "") for cell in row):
+            continue
+        if first_row:
+            # A header row, if present, says which column is which
+            first_row = False
+            header = header_columns(row)
+            if header is not None:
+                columns = header
+                continue
+        batch.append((number, [row[col] if col is not None and col < len(row) else None for col in columns]))
+        if len(batch) >= batch_size:
+            _plan_batch(store, plan, seen, batch)
+            batch = []
+    if batch:
+        _plan_batch(store, plan, seen, batch)
+    return plan
+
+
+def _plan_batch(store, plan, seen, batch):
+    date_added = datetime.now().strftime("%Y-%m-%d %H:%M")
+    for number, (brand, price, category, service_type, date) in batch:
+        brand = str(brand).strip() if brand is not None else ""
+        category = str(category).strip() if category is not None else ""
+        service_type = str(service_type).strip() if service_type is not None else ""
+        try:
+            price_float = validate_entry(brand, price, category)
+        except ValueError as e:
+            plan.rejects.append((number, str(e)))
+            continue
+        if not service_type:
+            plan.rejects.append((number, "Missing service type"))
+            continue
+
+        key = duplicate_key(brand, service_type)
+        if key in seen:
+            plan.rejects.append((number, f"Repeats line {seen[key]}"))
+            continue
+        seen[key] = number
+
+        values = [brand, price_float, category, service_type, str(date) if date else date_added]
+        existing = store.find(brand, service_type)
+        if existing:
+            plan.conflicts.append((next(iter(existing)), values))
+        else:
+            plan.inserts.append(values)
+
+
+def apply_import(store, plan, update_conflicts=True):
+    # Applies the whole plan as one store batch, so it is saved in one
+    # write. Conflicting rows update the existing entry's price and
+    # category but keep its original date, as update_entry does.
+    updates = []
+    if update_conflicts:
+        for record_id, values in plan.conflicts:
+            updates.append((record_id, values[:4] + [store.get(record_id)[4]]))
+    new_ids = store.apply(adds=plan.inserts, updates=updates)
+    return new_ids, [record_id for record_id, _ in updates]
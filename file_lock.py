@@ -0,0 +1,66 @@
+import os
+import socket
+import time
+
+
+class FileLock:
+    # Advisory lock shared by every app instance using the same price list,
+    # including instances on other PCs when the file is on a network share.
+    # Whoever manages to create the lock file exclusively holds the lock; it
+    # records who that is so a waiting instance can say so. A lock file
+    # older than `stale` seconds is left over from a crash and is broken.
+
+    def __init__(self, path, timeout=10.0, stale=120.0):
+        self.path = path
+        self.timeout = timeout
+        self.stale = stale
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except (FileExistsError, PermissionError):
+                # Windows reports a lock file that is being deleted as PermissionError
+                if self._is_stale():
+                    self._break()
+                    continue
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"The price list is in use by {self.owner() or 'another user'}")
+                time.sleep(0.05)
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(f"{socket.gethostname()} (process {os.getpid()})")
+            return
+
+    def release(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def owner(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return f.read().strip()
+        except OSError:
+            return ""
+
+    def _is_stale(self):
+        try:
+            return time.time() - os.path.getmtime(self.path) > self.stale
+        except OSError:
+            return False
+
+    def _break(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
@@ -0,0 +1,18 @@
+import os
+import shutil
+
+# Read once at import; os.umask can only be read by setting it, which would
+# race with other threads creating files
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+def keep_mode(tmp_path, path):
+    # tempfile.mkstemp makes files only their owner can read. Before one
+    # replaces path, give it path's permissions, or for a new file the ones
+    # open() would have given it, so other users sharing the folder can
+    # still open it.
+    if os.path.exists(path):
+        shutil.copymode(path, tmp_path)
+    else:
+        os.chmod(tmp_path, 0o666 & ~UMASK)
@@ -0,0 +1,72 @@
+import json
+import os
+import uuid
+from datetime import datetime
+
+
+class Journal:
+    # Append-only change log kept next to the workbook. Every change set is
+    # written as JSON lines and fsync'd before the slower workbook save, so
+    # a crash or power cut loses nothing that reached the journal. After the
+    # workbook has been compacted the journal is moved onto the end of an
+    # audit log and started afresh.
+    #
+    # Instances sharing a workbook share its journal; each entry carries
+    # the session that wrote it so an instance can pick out other people's
+    # changes.
+
+    def __init__(self, path, audit_path=None):
+        self.path = path
+        self.audit_path = audit_path
+        self.session = uuid.uuid4().hex
+
+    def append(self, changes):
+        if not changes:
+            return
+        stamp = datetime.now().isoformat(timespec="seconds")
+        lines = []
+        for action, record_id, row in changes:
+            lines.append(json.dumps({"ts": stamp, "session": self.session, "op": action, "id": record_id, "row": row},
+                                    default=str))
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read(self, exclude_session=None):
+        # Yields (action, record ID, row); a torn last line from a crash is skipped
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if exclude_session is not None and entry.get("session") == exclude_session:
+                    continue
+                yield entry["op"], entry["id"], entry["row"]
+
+    def pending(self, exclude_session=None):
+        # Net effect of the journal: record ID -> final row, or None if removed
+        changes = {}
+        for action, record_id, row in self.read(exclude_session):
+            changes[record_id] = None if action == "remove" else row
+        return changes
+
+    def signature(self):
+        # Changes whenever anyone appends to or compacts the journal
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def compacted(self):
+        # Called once the workbook holds everything in the journal
+        if not os.path.exists(self.path):
+            return
+        if self.audit_path:
+            with open(self.path, "rb") as src, open(self.audit_path, "ab") as dst:
+                dst.write(src.read())
+        os.remove(self.path)
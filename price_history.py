@@ -0,0 +1,260 @@
+import array
+import csv
+import math
+import os
+import time
+from datetime import datetime
+
+from storage import ID_COLUMN, duplicate_key
+
+ACTIONS = ("add", "update", "remove")
+HISTORY_HEADERS = ["Changed", "Change", "ID", "Brand", "Price", "Category", "Service Type", "Date Added"]
+
+
+def parse_timestamp(value):
+    # Epoch seconds for a datetime or a "YYYY-MM-DD[ HH:MM]" string, else None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        return datetime.fromisoformat(str(value).strip()).timestamp()
+    except ValueError:
+        return None
+
+
+def price_value(value):
+    try:
+        return float(str(value).strip().lstrip('$').replace(',', ''))
+    except ValueError:
+        return math.nan
+
+
+class PriceTrend:
+    # Summary of the price versions of one brand and service type
+    def __init__(self, versions):
+        prices = [(changed, price) for changed, action, _, _, price, _, _, _ in versions
+                  if action != "remove" and not math.isnan(price)]
+        self.versions = len(prices)
+        self.first = prices[0][1] if prices else None
+        self.last = prices[-1][1] if prices else None
+        self.low = min(price for _, price in prices) if prices else None
+        self.high = max(price for _, price in prices) if prices else None
+        self.previous = None
+        self.last_changed = None
+        for (_, before), (changed, after) in zip(prices, prices[1:]):
+            if after != before:
+                self.previous = before
+                self.last_changed = changed
+
+    def change_percent(self):
+        # Change from the first recorded price to the current one
+        if not self.first or self.last is None:
+            return None
+        return (self.last - self.first) * 100 / self.first
+
+    def summary(self):
+        if self.last is None:
+            return "No prices recorded"
+        parts = [f"Now ${self.last:g}", f"low ${self.low:g}", f"high ${self.high:g}"]
+        if self.last_changed is not None:
+            parts.append(f"last changed {self.last_changed:%Y-%m-%d} from ${self.previous:g}")
+        percent = self.change_percent()
+        if percent is not None and self.versions > 1:
+            parts.append(f"{percent:+.1f}% since first recorded")
+        return ", ".join(parts)
+
+
+class PriceHistory:
+    # Every version of every entry, kept column-wise in typed arrays in the
+    # order they were recorded. Record IDs, brands, categories, service types
+    # and dates are interned into one string table and stored as indexes, so
+    # an entry costs about 40 bytes however long its strings are. New
+    # versions are appended to <file>.history.csv by save().
+    #
+    # Entries that predate the history get a baseline version, dated when
+    # they were added, the first time they change, so as_of() can tell what
+    # they cost before that.
+    #
+    # A version is (changed datetime, action, record ID, brand, price,
+    # category, service type, date added).
+
+    def __init__(self, path):
+        self.path = path
+        self.strings = []
+        self._string_ids = {}
+        self.times = array.array("d")
+        self.actions = array.array("b")
+        self.records = array.array("i")
+        self.brands = array.array("i")
+        self.prices = array.array("d")
+        self.categories = array.array("i")
+        self.services = array.array("i")
+        self.dates = array.array("i")
+        self._by_key = {}  # duplicate key -> positions of its versions, up to _indexed
+        self._indexed = 0
+        self._known = set()  # string indexes of record IDs with versions
+        self._saved = 0
+
+    def __len__(self):
+        return len(self.times)
+
+    def _intern(self, value):
+        value = "" if value is None else str(value)
+        index = self._string_ids.get(value)
+        if index is None:
+            index = self._string_ids[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+    def _append(self, when, action, record_id, row):
+        record = self._intern(record_id)
+        self.times.append(when)
+        self.actions.append(action)
+        self.records.append(record)
+        self.brands.append(self._intern(row[0]))
+        self.prices.append(price_value(row[1]))
+        self.categories.append(self._intern(row[2]))
+        self.services.append(self._intern(row[3]))
+        self.dates.append(self._intern(row[4]))
+        self._known.add(record)
+
+    def record(self, action, record_id, row, previous=None):
+        # row is the new version, or the removed one for removals; previous
+        # is the version being replaced
+        now = time.time()
+        if previous is not None and not self.has_versions(record_id):
+            added = parse_timestamp(previous[4])
+            self._append(min(added, now) if added is not None else 0.0, 0, record_id, previous)
+        self._append(now, ACTIONS.index(action), record_id, row)
+
+    def version(self, position):
+        strings = self.strings
+        return (
+            datetime.fromtimestamp(self.times[position]),
+            ACTIONS[self.actions[position]],
+            strings[self.records[position]],
+            strings[self.brands[position]],
+            self.prices[position],
+            strings[self.categories[position]],
+            strings[self.services[position]],
+            strings[self.dates[position]],
+        )
+
+    def current_version(self, row):
+        # A version for an entry that has none recorded, dated when it was added
+        added = parse_timestamp(row[4])
+        return (datetime.fromtimestamp(added if added is not None else 0.0), "add", row[ID_COLUMN],
+                row[0], price_value(row[1]), row[2], row[3], "" if row[4] is None else str(row[4]))
+
+    def has_versions(self, record_id):
+        return self._string_ids.get(str(record_id)) in self._known
+
+    def _index_keys(self):
+        # Only history lookups need the brand/service index, so it is brought
+        # up to date on demand. Positions are grouped by their interned brand
+        # and service first so each distinct pair is casefolded once.
+        end = len(self.times)
+        pairs = {}
+        for position, pair in enumerate(zip(self.brands[self._indexed:end], self.services[self._indexed:end]),
+                                        self._indexed):
+            pairs.setdefault(pair, []).append(position)
+        for (brand, service_type), positions in pairs.items():
+            key = duplicate_key(self.strings[brand], self.strings[service_type])
+            self._by_key.setdefault(key, array.array("i")).extend(positions)
+        self._indexed = end
+
+    def versions(self, brand, service_type):
+        # Oldest first
+        self._index_keys()
+        positions = sorted(self._by_key.get(duplicate_key(brand, service_type), ()),
+                           key=self.times.__getitem__)
+        return [self.version(position) for position in positions]
+
+    def as_of(self, when, rows):
+        # The price list as it stood at `when` (epoch seconds), in the same
+        # row layout as the store. Entries without versions are taken from
+        # rows if they had been added by then.
+        latest = {}
+        times = self.times
+        for position in range(len(times)):
+            if times[position] <= when:
+                record = self.records[position]
+                best = latest.get(record)
+                if best is None or times[best] <= times[position]:
+                    latest[record] = position
+        strings = self.strings
+        result = []
+        for row in rows:
+            if not self.has_versions(row[ID_COLUMN]):
+                added = parse_timestamp(row[4])
+                if added is None or added <= when:
+                    result.append(list(row))
+        for record, position in latest.items():
+            if self.actions[position] != 2:
+                result.append([
+                    strings[self.brands[position]],
+                    self.prices[position],
+                    strings[self.categories[position]],
+                    strings[self.services[position]],
+                    strings[self.dates[position]],
+                    strings[record],
+                ])
+        return result
+
+    def load(self):
+        # Builds each column in one pass over the file rather than entry by entry
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            # A torn last line from a crash is skipped
+            lines = [line[:len(HISTORY_HEADERS)] for line in reader
+                     if len(line) >= len(HISTORY_HEADERS) and line[1] in ACTIONS]
+        times = [parse_timestamp(line[0]) for line in lines]
+        if None in times:
+            lines = [line for line, when in zip(lines, times) if when is not None]
+            times = [when for when in times if when is not None]
+        if not lines:
+            return
+
+        _, actions, records, brands, prices, categories, services, dates = zip(*lines)
+        ids = self._string_ids
+        for column in (records, brands, categories, services, dates):
+            for value in set(column):
+                self._intern(value)
+        codes = {action: code for code, action in enumerate(ACTIONS)}
+        start = len(self.times)
+        self.times.extend(times)
+        self.actions.extend(map(codes.__getitem__, actions))
+        self.records.extend(map(ids.__getitem__, records))
+        self.brands.extend(map(ids.__getitem__, brands))
+        self.prices.extend(map(price_value, prices))
+        self.categories.extend(map(ids.__getitem__, categories))
+        self.services.extend(map(ids.__getitem__, services))
+        self.dates.extend(map(ids.__getitem__, dates))
+        self._known.update(self.records[start:])
+        self._saved = len(self.times)
+
+    def save(self):
+        # Appends the versions recorded since the last save
+        end = len(self.times)
+        if end == self._saved:
+            return
+        new_file = not os.path.exists(self.path)
+        strings = self.strings
+        with open(self.path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(HISTORY_HEADERS)
+            writer.writerows(
+                (datetime.fromtimestamp(self.times[position]).isoformat(timespec="seconds"),
+                 ACTIONS[self.actions[position]],
+                 strings[self.records[position]],
+                 strings[self.brands[position]],
+                 self.prices[position],
+                 strings[self.categories[position]],
+                 strings[self.services[position]],
+                 strings[self.dates[position]])
+                for position in range(self._saved, end)
+            )
+        self._saved = end
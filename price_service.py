@@ -0,0 +1,124 @@
+import os
+from datetime import datetime
+
+from bulk_import import apply_import, plan_import
+from price_history import PriceTrend, parse_timestamp
+from price_store import PriceStore, validate_entry
+from repricing import apply_repricing, plan_repricing
+from search_index import index_record, record_matches
+from service_catalog import ServiceCatalog
+from storage import ID_COLUMN
+from undo import UndoStack
+
+
+class DuplicateEntryError(ValueError):
+    def __init__(self, brand, service_type):
+        super().__init__(f"A record for {brand} with {service_type} already exists.")
+        self.brand = brand
+        self.service_type = service_type
+
+
+class PriceService:
+    # The price list operations without any UI: validation, duplicate
+    # checks and persistence. The Tkinter app and the command line both work
+    # through this class. Duplicates raise DuplicateEntryError unless the
+    # caller passes allow_duplicate=True, so each front end decides how to
+    # ask. Every change can be undone through self.undo, as one step
+    # labelled after the operation.
+
+    def __init__(self, path, store=None, undo_depth=100):
+        self.path = path
+        self.store = store if store is not None else PriceStore(path)
+        self.undo = UndoStack(self.store, depth=undo_depth)
+        self.catalog = ServiceCatalog(path + ".services.json")
+
+    def open(self, create=True, read_only=False):
+        # Loads the file synchronously, creating it first if needed and
+        # allowed; otherwise a missing file is an error. A read-only open
+        # writes nothing, not even on close, and refuses to save changes.
+        if (read_only or not create) and not os.path.exists(self.path):
+            raise FileNotFoundError(f"No such file: {self.path}")
+        self.store.read_only = read_only
+        if not read_only:
+            self.store.create()
+        self.catalog.load(create=not read_only)
+        self.store.load()
+        return self
+
+    def close(self):
+        self.store.close()
+
+    def get(self, record_id):
+        if record_id not in self.store.positions:
+            raise KeyError(f"No entry with ID {record_id}")
+        return self.store.get(record_id)
+
+    def check_duplicate(self, brand, service_type, current_id=None):
+        return self.store.has_duplicate(brand, service_type, exclude=current_id)
+
+    def add(self, brand, price, category, service_type, allow_duplicate=False):
+        brand = brand.strip()
+        price_float = validate_entry(brand, price, category)
+        if not allow_duplicate and self.check_duplicate(brand, service_type):
+            raise DuplicateEntryError(brand, service_type)
+        date_added = datetime.now().strftime("%Y-%m-%d %H:%M")
+        with self.undo.group(f"Add {brand}"):
+            return self.store.add([brand, price_float, category, service_type, date_added])
+
+    def update(self, record_id, brand, price, category, service_type, allow_duplicate=False):
+        # Keeps the original "Date Added"; duplicates are only checked when
+        # the brand or service type changes
+        current = self.get(record_id)
+        brand = brand.strip()
+        price_float = validate_entry(brand, price, category)
+        if (brand.lower() != str(current[0]).lower() or service_type != current[3]):
+            if not allow_duplicate and self.check_duplicate(brand, service_type, record_id):
+                raise DuplicateEntryError(brand, service_type)
+        with self.undo.group(f"Update {brand}"):
+            self.store.update(record_id, [brand, price_float, category, service_type, current[4]])
+
+    def remove(self, record_id):
+        row = self.get(record_id)
+        with self.undo.group(f"Remove {row[0]}"):
+            self.store.remove(record_id)
+
+    def plan_import(self, path):
+        return plan_import(self.store, path)
+
+    def apply_import(self, plan, update_conflicts=True):
+        with self.undo.group("Import"):
+            return apply_import(self.store, plan, update_conflicts)
+
+    def plan_repricing(self, record_ids, rules):
+        return plan_repricing(self.store, record_ids, rules)
+
+    def apply_repricing(self, plan):
+        with self.undo.group("Bulk reprice"):
+            return apply_repricing(self.store, plan)
+
+    def export(self, path):
+        self.store.export(path)
+
+    def history(self, brand, service_type):
+        return self.store.price_history(brand.strip(), service_type)
+
+    def trend(self, brand, service_type):
+        return PriceTrend(self.history(brand, service_type))
+
+    def as_of(self, date):
+        # The price list at the end of date ("YYYY-MM-DD"), or at an exact
+        # "YYYY-MM-DD HH:MM"
+        when = parse_timestamp(date)
+        if when is None:
+            raise ValueError(f"Invalid date: {date}")
+        if len(date.strip()) <= len("YYYY-MM-DD"):
+            when += 24 * 60 * 60 - 0.000001
+        return self.store.as_of(when)
+
+    def query(self, query, as_of=None):
+        # Linear scan; fine for one-off lookups without building the indexes
+        rows = self.as_of(as_of) if as_of else self.store.rows
+        return [row for row in rows if record_matches(index_record(row), query)]
+
+    def select(self, query):
+        return [row[ID_COLUMN] for row in self.query(query)]
@@ -0,0 +1,513 @@
+import threading
+
+from file_lock import FileLock
+from journal import Journal
+from price_history import PriceHistory
+from save_worker import SaveWorker
+from storage import ID_COLUMN, duplicate_key, export_workbook, new_record_id, open_backend, usable_row
+
+
+def validate_entry(brand, price, category):
+    # Shared by the entry form and imports; returns the price as a float
+    if not brand or not price or not category:
+        raise ValueError("Please fill in all fields")
+    try:
+        price_float = float(str(price).strip().lstrip('$').replace(',', ''))
+    except ValueError:
+        raise ValueError("Invalid price format")
+    if not price_float > 0:
+        raise ValueError("Price must be greater than 0")
+    return price_float
+
+
+def stored_rows(rows):
+    # Yields (row, whether its ID was just assigned) for each usable row
+    # from a backend. Older files have no ID column (the ID is None); those
+    # rows get one.
+    seen = set()
+    for row in rows:
+        if usable_row(row):
+            record_id = row[ID_COLUMN] if len(row) > ID_COLUMN else None
+            assigned = not record_id or str(record_id) in seen
+            if assigned:
+                record_id = new_record_id()
+            record_id = str(record_id)
+            seen.add(record_id)
+            yield list(row[:ID_COLUMN]) + [record_id], assigned
+
+
+def same_row(a, b):
+    # Compares the data columns; None stands for a missing row
+    if a is None or b is None:
+        return a is b
+    return list(a[:ID_COLUMN]) == list(b[:ID_COLUMN])
+
+
+class DuplicateIndex:
+    # Maps (casefolded brand, service type) to the IDs of the rows sharing
+    # that key, so duplicate checks don't have to walk every row
+
+    def __init__(self):
+        self._groups = {}
+
+    def clear(self):
+        self._groups.clear()
+
+    def add(self, row):
+        self._groups.setdefault(duplicate_key(row[0], row[3]), set()).add(row[ID_COLUMN])
+
+    def discard(self, row):
+        key = duplicate_key(row[0], row[3])
+        group = self._groups.get(key)
+        if group is None:
+            return
+        group.discard(row[ID_COLUMN])
+        if not group:
+            del self._groups[key]
+
+    def find(self, brand, service_type):
+        return self._groups.get(duplicate_key(brand, service_type), set())
+
+    def contains(self, brand, service_type, exclude=None):
+        group = self._groups.get(duplicate_key(brand, service_type), ())
+        return any(record_id != exclude for record_id in group)
+
+    def groups(self):
+        # Only keys held by more than one row
+        return {key: set(group) for key, group in self._groups.items() if len(group) > 1}
+
+
+class PriceStore:
+    # Holds the price list in memory and writes it back in the background.
+    # Edits only touch the in-memory rows and queue a change set for the
+    # SaveWorker thread, which hands them to the storage backend in one go
+    # once edits pause, retrying if the file is locked. The
+    # Excel backend saves a full snapshot to a temp file and renames it over
+    # the workbook, so a crash mid-save never leaves a half-written file;
+    # the SQLite backend applies just the changed rows.
+    #
+    # Rewriting a workbook is slow, so for Excel every change set is first
+    # appended to a journal next to it (<workbook>.journal) and fsync'd; the
+    # workbook itself is only rewritten after 30 quiet seconds and on close.
+    # A journal left behind by a crash is replayed over the workbook on the
+    # next load. Compacted journals are kept in <workbook>.audit.jsonl.
+    #
+    # Several instances may share one workbook. Journal appends and workbook
+    # saves happen under <workbook>.lock, and if anyone else has saved since
+    # we last read the file, the save is a three-way merge by record ID:
+    # rows only they changed are taken from the file, rows only we changed
+    # from memory, and where both changed a row ours wins and the ID is
+    # reported through take_conflicts(). _base keeps each row we have
+    # changed as it was when we were last in sync, which is what makes the
+    # merge three-way. remote_changes()/apply_remote() bring other people's
+    # edits into memory without a full reload.
+    #
+    # Every add, update and removal is also recorded as a version in
+    # history (see PriceHistory), saved alongside the other changes.
+    #
+    # Listeners are called with each batch of edits as (record ID, row
+    # before, row after) once it is in memory; the undo stack is one.
+    # Remote listeners are called with the IDs apply_remote() changed.
+    #
+    # Every row carries a persistent ID in the column after the data. The ID
+    # doubles as the Treeview iid and maps straight to the row's position.
+
+    def __init__(self, excel_file, backend=None, flush_delay=None):
+        self.excel_file = excel_file
+        self.backend = backend if backend is not None else open_backend(excel_file)
+        self.flush_delay = flush_delay if flush_delay is not None else self.backend.flush_delay
+        self.rows = []
+        self.positions = {}  # record ID -> index into rows (sheet row - 2)
+        self.duplicates = DuplicateIndex()
+        self._lock = threading.Lock()
+        self._changes = []  # (action, record ID, row) not yet queued for writing
+        self._edits = []  # (record ID, before, after) not yet passed to the listeners
+        self.listeners = []
+        self.remote_listeners = []
+        self._base = {}  # record ID -> row as last saved (None if new) for rows changed since
+        self._synced = None  # signature of the file as we last read or wrote it
+        self._conflicts = []
+        self.history = PriceHistory(excel_file + ".history.csv")
+        self.journal = None
+        if self.backend.uses_journal:
+            self.journal = Journal(excel_file + ".journal", audit_path=excel_file + ".audit.jsonl")
+        self._file_lock = None
+        if self.backend.full_snapshot or self.backend.uses_journal:
+            self._file_lock = FileLock(excel_file + ".lock")
+        self._worker = SaveWorker(self._write, self.flush_delay,
+                                  log=self._log if self.journal is not None else None)
+        self._loaded = threading.Event()
+        self._loaded.set()
+        self.load_error = None  # Set when the last load failed; nothing is written after that
+        self.read_only = False  # Set before load() to only read: no write-back, cache or saves
+
+    def create(self):
+        self.backend.create()
+
+    def load(self, on_batch=None, batch_size=500):
+        # Streams the rows from the backend (the sheet in read-only mode for
+        # Excel). Rows are added to the store a batch at a time and handed to
+        # on_batch(rows, total_rows), so a caller on another thread can show
+        # them before the load finishes. Flushes wait until the load is
+        # complete, and fail if it did not complete, so a partial sheet is
+        # never written back.
+        self._loaded.clear()
+        self.load_error = None
+        self.backend.read_only = self.read_only
+        assigned_ids = False
+        replayed = []
+        try:
+            # Changes from the journal that never made it into the file
+            replay = self.journal.pending() if self.journal is not None else {}
+            with self._lock:
+                self.rows = []
+                self.positions = {}
+                self.duplicates.clear()
+                self._base = {}
+                self.history = PriceHistory(self.history.path)
+            self.history.load()
+
+            self._synced = self._signature()
+            total_rows, rows = self.backend.read()
+            batch = []
+            seen = set()
+            for row, assigned in stored_rows(rows):
+                # Rows that got a new ID are saved back with it
+                assigned_ids = assigned_ids or assigned
+                record_id = row[ID_COLUMN]
+                seen.add(record_id)
+                if record_id in replay:
+                    self._base[record_id] = row
+                    row = replay.pop(record_id)
+                    replayed.append(("remove" if row is None else "update", record_id, row))
+                    if row is None:
+                        continue
+                batch.append(list(row[:ID_COLUMN]) + [record_id])
+                if len(batch) >= batch_size:
+                    self._append_loaded(batch, on_batch, total_rows)
+                    batch = []
+            # Whatever is left in the journal was added after the last save
+            for record_id, row in replay.items():
+                if row is not None and record_id not in seen:
+                    self._base[record_id] = None
+                    replayed.append(("add", record_id, row))
+                    batch.append(list(row[:ID_COLUMN]) + [record_id])
+            if batch:
+                self._append_loaded(batch, on_batch, total_rows)
+            assigned_ids = assigned_ids or bool(self.backend.new_ids)
+        except BaseException as e:
+            self.load_error = e
+            raise
+        finally:
+            self._loaded.set()
+        if self.read_only:
+            # Journaled changes are in memory; IDs made up for rows without
+            # one are not kept
+            return self.rows
+        if replayed:
+            # Already journaled; only needs compacting into the file
+            self._worker.submit(replayed, log=False)
+        if assigned_ids:
+            # Nothing changed, but the file needs the new IDs
+            self._schedule_flush(save=True)
+        return self.rows
+
+    def _append_loaded(self, batch, on_batch, total_rows):
+        with self._lock:
+            for row in batch:
+                self.positions[row[ID_COLUMN]] = len(self.rows)
+                self.rows.append(row)
+                self.duplicates.add(row)
+        if on_batch is not None:
+            on_batch(batch, total_rows)
+
+    def get(self, record_id):
+        return self.rows[self.positions[record_id]]
+
+    def sheet_row(self, record_id):
+        return self.positions[record_id] + 2
+
+    def add(self, values):
+        with self._lock:
+            record_id = self._add_row(values)
+        self._schedule_flush()
+        return record_id
+
+    def update(self, record_id, values):
+        with self._lock:
+            self._update_row(record_id, values)
+        self._schedule_flush()
+
+    def remove(self, record_id):
+        with self._lock:
+            position = self.positions.pop(record_id)
+            self._base.setdefault(record_id, list(self.rows[position]))
+            self._edits.append((record_id, list(self.rows[position]), None))
+            self.history.record("remove", record_id, self.rows[position], previous=self.rows[position])
+            self.duplicates.discard(self.rows[position])
+            del self.rows[position]
+            # Rows below the deleted one shift up, same as sheet.delete_rows
+            for idx in range(position, len(self.rows)):
+                self.positions[self.rows[idx][ID_COLUMN]] = idx
+            self._changes.append(("remove", record_id, None))
+        self._schedule_flush()
+
+    def apply(self, adds=(), updates=(), removes=(), restores=()):
+        # Many changes under one lock and one flush; returns the new IDs.
+        # Removals rebuild the position map once instead of per row.
+        # restores are removed rows, with their IDs, to add back.
+        with self._lock:
+            if removes:
+                for record_id in set(removes):
+                    self._base.setdefault(record_id, list(self.get(record_id)))
+                    self._edits.append((record_id, list(self.get(record_id)), None))
+                    self.history.record("remove", record_id, self.get(record_id), previous=self.get(record_id))
+                    self._changes.append(("remove", record_id, None))
+                self._remove_rows(set(removes))
+            for record_id, values in updates:
+                self._update_row(record_id, values)
+            new_ids = [self._add_row(values) for values in adds]
+            for row in restores:
+                self._add_row(row[:ID_COLUMN], row[ID_COLUMN])
+        self._schedule_flush()
+        return new_ids
+
+    def _remove_rows(self, doomed):
+        for record_id in doomed:
+            self.duplicates.discard(self.get(record_id))
+        self.rows = [row for row in self.rows if row[ID_COLUMN] not in doomed]
+        self.positions = {row[ID_COLUMN]: idx for idx, row in enumerate(self.rows)}
+
+    def _add_row(self, values, record_id=None):
+        if record_id is None:
+            record_id = new_record_id()
+        self._base.setdefault(record_id, None)
+        row = list(values[:ID_COLUMN]) + [record_id]
+        self.positions[record_id] = len(self.rows)
+        self.rows.append(row)
+        self.duplicates.add(row)
+        self.history.record("add", record_id, row)
+        self._edits.append((record_id, None, list(row)))
+        self._changes.append(("add", record_id, list(row)))
+        return record_id
+
+    def _update_row(self, record_id, values):
+        row = self.rows[self.positions[record_id]]
+        previous = list(row)
+        self._base.setdefault(record_id, previous)
+        self.duplicates.discard(row)
+        row[:ID_COLUMN] = values[:ID_COLUMN]
+        self.duplicates.add(row)
+        self.history.record("update", record_id, row, previous=previous)
+        self._edits.append((record_id, previous, list(row)))
+        self._changes.append(("update", record_id, list(row)))
+
+    def price_history(self, brand, service_type):
+        # Versions of a brand and service type, oldest first; entries that
+        # have never changed contribute their current version
+        with self._lock:
+            versions = self.history.versions(brand, service_type)
+            for record_id in self.duplicates.find(brand, service_type):
+                if not self.history.has_versions(record_id):
+                    versions.append(self.history.current_version(self.get(record_id)))
+        versions.sort(key=lambda version: version[0])
+        return versions
+
+    def as_of(self, when):
+        # The rows as they stood at `when` (epoch seconds)
+        with self._lock:
+            return self.history.as_of(when, self.rows)
+
+    def find(self, brand, service_type):
+        return self.duplicates.find(brand, service_type)
+
+    def has_duplicate(self, brand, service_type, exclude=None):
+        return self.duplicates.contains(brand, service_type, exclude)
+
+    def duplicate_groups(self):
+        # Label each group with the brand spelling of one of its rows
+        groups = {}
+        for key, record_ids in self.duplicates.groups().items():
+            row = self.get(next(iter(record_ids)))
+            groups[(row[0], row[3])] = len(record_ids)
+        return groups
+
+    @property
+    def status(self):
+        return self._worker.status
+
+    def _schedule_flush(self, save=False):
+        # Queued under the lock so change sets reach the writer in order.
+        # With no changes there is nothing to save unless save is given.
+        with self._lock:
+            changes = self._changes
+            self._changes = []
+            edits = self._edits
+            self._edits = []
+            if changes or save:
+                self._worker.submit(changes)
+        if edits:
+            for listener in self.listeners:
+                listener(edits)
+
+    def _signature(self):
+        return (self.backend.signature(), self.journal.signature() if self.journal is not None else None)
+
+    def _log(self, changes):
+        # Runs on the SaveWorker thread. Under the file lock so another
+        # instance compacting the journal can't drop the entries.
+        if self.read_only:
+            raise RuntimeError("Not saved; the price list was opened read-only")
+        with self._file_lock:
+            unchanged = self._signature() == self._synced
+            self.journal.append(changes)
+            self.history.save()
+            if unchanged:
+                self._synced = self._signature()
+
+    def _write(self, changes):
+        # Runs on the SaveWorker thread; only the snapshot copy holds the lock
+        self._loaded.wait()
+        if self.load_error is not None:
+            raise RuntimeError(f"Not saved; the price list did not load completely ({self.load_error})")
+        if self.read_only:
+            raise RuntimeError("Not saved; the price list was opened read-only")
+        with self._lock:
+            base = self._base
+            self._base = {}
+        try:
+            if self._file_lock is None:
+                self.history.save()
+                self.backend.write(changes, None)
+            else:
+                with self._file_lock:
+                    self.history.save()
+                    self._write_locked(changes, base)
+        except BaseException:
+            # Still unsaved; keep the older base for rows changed again since
+            with self._lock:
+                for record_id, row in self._base.items():
+                    base.setdefault(record_id, row)
+                self._base = base
+            raise
+
+    def _write_locked(self, changes, base):
+        merged = self._signature() != self._synced
+        if merged:
+            snapshot = self._merge(self._read_theirs(), base)
+        else:
+            with self._lock:
+                snapshot = [list(row) for row in self.rows]
+        self.backend.write(changes, snapshot)
+        if self.journal is not None:
+            self.journal.compacted()
+        # After a merge the rows in memory lag behind the file until
+        # remote_changes() has been applied
+        self._synced = None if merged else self._signature()
+
+    def _read_theirs(self):
+        # record ID -> row as the other instances have it: the file plus
+        # their entries in the journal
+        _, rows = self.backend.read()
+        theirs = {row[ID_COLUMN]: row for row, _ in stored_rows(rows)}
+        if self.journal is not None:
+            for record_id, row in self.journal.pending(exclude_session=self.journal.session).items():
+                if row is None:
+                    theirs.pop(record_id, None)
+                else:
+                    theirs[record_id] = list(row[:ID_COLUMN]) + [record_id]
+        return theirs
+
+    def _merge(self, theirs, base):
+        merged = []
+        with self._lock:
+            for record_id, row in theirs.items():
+                if record_id not in base:
+                    merged.append(row)
+                elif record_id in self.positions:
+                    merged.append(list(self.get(record_id)))
+            for record_id, original in base.items():
+                mine = self.get(record_id) if record_id in self.positions else None
+                if record_id not in theirs and mine is not None:
+                    merged.append(list(mine))
+                # A conflict is a row they changed too, differently from us
+                if not same_row(theirs.get(record_id), original) and not same_row(theirs.get(record_id), mine):
+                    self._conflicts.append(record_id)
+        return merged
+
+    def changed_externally(self):
+        # Cheap enough to poll: compares file signatures only
+        return self._loaded.is_set() and self.load_error is None and self._signature() != self._synced
+
+    def remote_changes(self):
+        # Re-reads the file and returns what other instances changed as
+        # (action, record ID, row) for apply_remote(). Safe to call off the
+        # Tk thread. Rows changed here since the last save are left out.
+        signature = self._signature()
+        theirs = self._read_theirs()
+        changes = []
+        with self._lock:
+            for record_id, row in theirs.items():
+                if record_id in self._base:
+                    continue
+                position = self.positions.get(record_id)
+                if position is None:
+                    changes.append(("add", record_id, row))
+                elif not same_row(row, self.rows[position]):
+                    changes.append(("update", record_id, row))
+            for row in self.rows:
+                if row[ID_COLUMN] not in theirs and row[ID_COLUMN] not in self._base:
+                    changes.append(("remove", row[ID_COLUMN], None))
+        self._synced = signature
+        return changes
+
+    def apply_remote(self, changes):
+        # Applies remote_changes() to memory only, as they are already saved.
+        # Rows edited here in the meantime keep our version. Returns the
+        # added, updated and removed IDs.
+        added, updated, removed = [], [], []
+        with self._lock:
+            for action, record_id, row in changes:
+                if record_id in self._base:
+                    continue
+                if action == "add" and record_id not in self.positions:
+                    row = list(row[:ID_COLUMN]) + [record_id]
+                    self.positions[record_id] = len(self.rows)
+                    self.rows.append(row)
+                    self.duplicates.add(row)
+                    added.append(record_id)
+                elif action == "update" and record_id in self.positions:
+                    current = self.get(record_id)
+                    self.duplicates.discard(current)
+                    current[:ID_COLUMN] = row[:ID_COLUMN]
+                    self.duplicates.add(current)
+                    updated.append(record_id)
+                elif action == "remove" and record_id in self.positions:
+                    removed.append(record_id)
+            if removed:
+                self._remove_rows(set(removed))
+        changed = added + updated + removed
+        if changed:
+            for listener in self.remote_listeners:
+                listener(changed)
+        return added, updated, removed
+
+    def take_conflicts(self):
+        # IDs of rows where a merge kept our edit over someone else's
+        with self._lock:
+            conflicts = self._conflicts
+            self._conflicts = []
+        return conflicts
+
+    def flush(self):
+        # Waits for everything queued so far to be written
+        self._worker.flush()
+
+    def close(self):
+        self._worker.flush(stop=True)
+        self.backend.close()
+
+    def export(self, path):
+        with self._lock:
+            snapshot = [list(row) for row in self.rows]
+        export_workbook(path, snapshot)
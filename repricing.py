@@ -0,0 +1,116 @@
+import array
+import math
+
+from price_history import price_value
+from storage import ID_COLUMN
+
+# Repricing rules, applied in order to every selected price:
+#   +8%  -5%       percentage change
+#   +2  -1.50      fixed amount
+#   set 30         new price
+#   floor 25       at least this much
+#   ceiling 200    at most this much
+#   round .99      nearest price ending in .99 (any ending below 1)
+#   round 5        nearest multiple of 5
+RULE_HELP = "+8%, -2, set 30, floor 25, ceiling 200, round .99, round 5"
+
+
+def parse_amount(text, rule):
+    try:
+        return float(text.strip().lstrip('$').replace(',', ''))
+    except ValueError:
+        raise ValueError(f"Invalid rule: {rule} (try {RULE_HELP})")
+
+
+class Rule:
+    def __init__(self, text):
+        self.text = text.strip()
+        words = self.text.lower().split(None, 1)
+        if not words:
+            raise ValueError("Empty rule")
+        if words[0] in ("set", "floor", "ceiling", "round") and len(words) == 2:
+            self.kind = words[0]
+            self.amount = parse_amount(words[1], self.text)
+            if self.kind == "round" and not self.amount > 0:
+                raise ValueError(f"Invalid rule: {self.text} (round needs an ending or a step above 0)")
+        elif self.text.endswith("%"):
+            self.kind = "percent"
+            self.amount = parse_amount(self.text[:-1], self.text)
+        elif self.text[0] in "+-":
+            self.kind = "add"
+            self.amount = parse_amount(self.text, self.text)
+        else:
+            raise ValueError(f"Invalid rule: {self.text} (try {RULE_HELP})")
+
+    def apply(self, prices):
+        # One pass over the whole column
+        amount = self.amount
+        if self.kind == "percent":
+            factor = 1 + amount / 100
+            return array.array("d", (price * factor for price in prices))
+        if self.kind == "add":
+            return array.array("d", (price + amount for price in prices))
+        if self.kind == "set":
+            return array.array("d", [amount]) * len(prices)
+        if self.kind == "floor":
+            return array.array("d", (max(price, amount) for price in prices))
+        if self.kind == "ceiling":
+            return array.array("d", (min(price, amount) for price in prices))
+        if amount < 1:
+            # Nearest whole number plus the ending, e.g. 27.40 -> 26.99
+            return array.array("d", (math.floor(price - amount + 0.5) + amount for price in prices))
+        return array.array("d", (round(price / amount) * amount for price in prices))
+
+
+class RepricePlan:
+    def __init__(self, rules):
+        self.rules = rules
+        self.changes = []  # (record ID, old price, new price)
+        self.rejects = []  # ("brand - service type", reason)
+
+    def summary(self, limit=10):
+        lines = [
+            "Rules: " + ", ".join(rule.text for rule in self.rules),
+            f"{len(self.changes)} prices change",
+            f"{len(self.rejects)} skipped",
+        ]
+        for label, reason in self.rejects[:limit]:
+            lines.append(f"  {label}: {reason}")
+        if len(self.rejects) > limit:
+            lines.append(f"  ...and {len(self.rejects) - limit} more")
+        return "\n".join(lines)
+
+
+def plan_repricing(store, record_ids, rules):
+    # Runs the rules over the selected prices column by column and returns
+    # the rows whose price actually changes
+    rules = [rule if isinstance(rule, Rule) else Rule(rule) for rule in rules]
+    plan = RepricePlan(rules)
+    rows = [store.get(record_id) for record_id in record_ids]
+    old = array.array("d", (price_value(row[1]) for row in rows))
+    new = old
+    for rule in rules:
+        new = rule.apply(new)
+    for row, before, after in zip(rows, old, new):
+        record_id = row[ID_COLUMN]
+        after = round(after, 2)
+        if math.isnan(before):
+            plan.rejects.append((f"{row[0]} - {row[3]}", "Current price is not a number"))
+        elif not after > 0:
+            plan.rejects.append((f"{row[0]} - {row[3]}", f"Price would be ${after:g}"))
+        elif after != before:
+            plan.changes.append((record_id, before, after))
+    return plan
+
+
+def apply_repricing(store, plan):
+    # All the new prices go to the store as one batch, so they are saved
+    # in one write; returns the updated IDs
+    updates = []
+    for record_id, _, price in plan.changes:
+        row = store.get(record_id)
+        updates.append((record_id, [row[0], price, row[2], row[3], row[4]]))
+    if updates:
+        store.apply(updates=updates)
+    return [record_id for record_id, _ in updates]
+
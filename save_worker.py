@@ -0,0 +1,133 @@
+import queue
+import threading
+import time
+
+
+class SaveWorker:
+    # Runs every save on one background thread so the UI never waits on
+    # disk I/O. Change sets are queued as they are made; once the queue has
+    # been quiet for `delay` seconds they are written together with one call
+    # to write(changes). A failed write (for instance the workbook is open
+    # in Excel) keeps its changes and is retried with exponential backoff,
+    # folding in anything queued meanwhile, so no edit is dropped.
+    #
+    # Steady editing never lets the queue go quiet, so pending changes are
+    # also written once the oldest has waited max_wait seconds or once
+    # max_pending of them have built up.
+    #
+    # If a log callable is given, each change set is passed to it as soon
+    # as it arrives (the store uses this for its journal), ahead of the
+    # debounced write.
+    #
+    # status is one of ("saved" | "pending" | "saving" | "failed", message)
+    # and is safe to poll from another thread.
+
+    def __init__(self, write, delay=1.0, max_backoff=30.0, log=None, max_wait=300.0, max_pending=1000):
+        self.write = write
+        self.log = log
+        self.delay = delay
+        self.max_backoff = max_backoff
+        self.max_wait = max_wait
+        self.max_pending = max_pending
+        self.status = ("saved", "")
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, changes, log=True):
+        self._put(("changes", (changes, log)))
+        if self.status[0] != "failed":
+            self.status = ("pending", "")
+
+    def flush(self, stop=False):
+        # Blocks until everything submitted so far has been written or the
+        # write has failed, in which case the error is raised. A failed stop
+        # leaves the worker running, still retrying.
+        if self._thread is None:
+            return
+        done = threading.Event()
+        result = {}
+        self._put(("stop" if stop else "flush", (done, result)))
+        done.wait()
+        if result.get("error") is not None:
+            raise result["error"]
+
+    def _put(self, item):
+        # Queued under the start lock so the thread can't exit between the
+        # put and the liveness check
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="SaveWorker", daemon=True)
+                self._thread.start()
+            self._queue.put(item)
+
+    def _run(self):
+        pending = []
+        dirty = False
+        deadline = None  # when the oldest pending change has waited max_wait
+        backoff = 0
+        waiters = []
+        stopping = False
+        while True:
+            now = time.monotonic()
+            if dirty and not backoff and (len(pending) >= self.max_pending or now >= deadline):
+                kind = None
+            else:
+                try:
+                    if waiters:
+                        # Someone is waiting; take what is queued and write now
+                        kind, payload = self._queue.get_nowait()
+                    else:
+                        timeout = None
+                        if dirty:
+                            timeout = backoff or min(self.delay, deadline - now)
+                        kind, payload = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    kind = None
+
+            if kind == "changes":
+                changes, log = payload
+                if log and self.log is not None:
+                    try:
+                        self.log(changes)
+                    except Exception as e:
+                        self.status = ("failed", f"Journal: {e}")
+                    else:
+                        if self.status[0] != "failed":
+                            self.status = ("saved", "")
+                pending.extend(changes)
+                if not dirty:
+                    deadline = time.monotonic() + self.max_wait
+                dirty = True
+                continue
+            if kind is not None:
+                waiters.append(payload)
+                stopping = stopping or kind == "stop"
+                continue
+
+            error = None
+            if dirty:
+                self.status = ("saving", "")
+                try:
+                    self.write(pending)
+                except Exception as e:
+                    error = e
+                    backoff = min(self.max_backoff, backoff * 2 if backoff else 0.5)
+                    self.status = ("failed", f"{e} (retrying in {backoff:g}s)")
+                else:
+                    pending = []
+                    dirty = False
+                    backoff = 0
+                    self.status = ("saved", "")
+
+            for done, result in waiters:
+                result["error"] = error
+                done.set()
+            waiters = []
+
+            if stopping and not dirty:
+                with self._start_lock:
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+            stopping = False
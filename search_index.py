@@ -0,0 +1,265 @@
+from bisect import bisect_left, insort
+from operator import itemgetter
+
+# Sorts after any record ID, for inclusive upper bounds on (key, record ID) pairs
+HIGHEST = chr(0x10FFFF)
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def parse_price(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def index_record(row):
+    # The normalized fields a query is matched against
+    return (str(row[0]).casefold(), parse_price(row[1]), row[2] or "", row[3] or "", str(row[4] or ""))
+
+
+def record_matches(record, query):
+    if query.text:
+        if len(query.text) < 3:
+            if not record[0].startswith(query.text):
+                return False
+        elif query.text not in record[0]:
+            return False
+    if query.service and record[3] != query.service:
+        return False
+    if query.category and record[2] != query.category:
+        return False
+    price = record[1]
+    if query.min_price is not None and (price is None or price < query.min_price):
+        return False
+    if query.max_price is not None and (price is None or price > query.max_price):
+        return False
+    # Dates are "YYYY-MM-DD HH:MM" strings, so comparing the day part is enough
+    day = record[4][:10]
+    if query.date_from and day < query.date_from:
+        return False
+    if query.date_to and day > query.date_to:
+        return False
+    return True
+
+
+class SearchQuery:
+    def __init__(self, text="", service="", category="", min_price=None, max_price=None,
+                 date_from="", date_to=""):
+        self.text = text.strip().casefold()
+        self.service = service
+        self.category = category
+        self.min_price = min_price
+        self.max_price = max_price
+        self.date_from = date_from
+        self.date_to = date_to
+
+    def is_empty(self):
+        return not (self.text or self.service or self.category or self.date_from or self.date_to
+                    or self.min_price is not None or self.max_price is not None)
+
+    def narrows(self, previous):
+        # True when every match of this query is also a match of previous,
+        # so the previous results can be filtered instead of searching again
+        if previous is None:
+            return False
+        if previous.text:
+            if len(previous.text) < 3:
+                # Short queries are prefix matches; only a longer prefix narrows them
+                if len(self.text) >= 3 or not self.text.startswith(previous.text):
+                    return False
+            elif previous.text not in self.text:
+                return False
+        for field in ("service", "category", "date_from", "date_to"):
+            old = getattr(previous, field)
+            if old and getattr(self, field) != old:
+                return False
+        if previous.min_price is not None and (self.min_price is None or self.min_price < previous.min_price):
+            return False
+        if previous.max_price is not None and (self.max_price is None or self.max_price > previous.max_price):
+            return False
+        return True
+
+
+def date_bounds(date_from, date_to):
+    # Bounds on the full "YYYY-MM-DD HH:MM" strings that select the same
+    # rows as comparing their first ten characters, the way record_matches
+    # does, also while a date is only partly typed
+    low = high = None
+    if date_from:
+        low = (date_from[:10] + HIGHEST,) if len(date_from) > 10 else (date_from,)
+    if date_to:
+        high = (date_to[:10] + HIGHEST,) if len(date_to) >= 10 else (date_to, HIGHEST)
+    return low, high
+
+
+class SearchIndex:
+    # Precomputed lookups for the filter bar. Brands are indexed by their
+    # casefolded spelling: a sorted list answers prefix queries, trigrams
+    # answer substring queries, and each distinct brand maps to its record
+    # IDs. Service and category buckets and sorted (price, ID) and
+    # (date, ID) lists answer the other criteria exactly, so a search is
+    # set intersections and slices rather than a check of every record.
+    #
+    # add_many() appends to the sorted lists and leaves sorting them to the
+    # next search or removal, so loading is one sort instead of an insort
+    # per row.
+
+    def __init__(self):
+        self.records = {}         # record ID -> (brand key, price, category, service, date)
+        self.brands = {}          # brand key -> set of record IDs
+        self.sorted_brands = []   # distinct brand keys, for prefix lookup
+        self.trigrams = {}        # trigram -> set of brand keys
+        self.services = {}        # service type -> set of record IDs
+        self.categories = {}      # category -> set of record IDs
+        self.prices = []          # sorted (price, record ID)
+        self.dates = []           # sorted (date, record ID)
+        self._unsorted = False    # the three sorted lists have had items appended
+
+    def add(self, row, record_id):
+        self._add(row, record_id, insort if not self._unsorted else list.append)
+
+    def add_many(self, rows):
+        # rows are (row, record ID) pairs
+        for row, record_id in rows:
+            self._add(row, record_id, list.append)
+        self._unsorted = True
+
+    def _add(self, row, record_id, place):
+        record = index_record(row)
+        brand_key = record[0]
+        self.records[record_id] = record
+
+        if brand_key not in self.brands:
+            self.brands[brand_key] = set()
+            place(self.sorted_brands, brand_key)
+            for gram in trigrams(brand_key):
+                self.trigrams.setdefault(gram, set()).add(brand_key)
+        self.brands[brand_key].add(record_id)
+        self.services.setdefault(record[3], set()).add(record_id)
+        self.categories.setdefault(record[2], set()).add(record_id)
+        if record[1] is not None:
+            place(self.prices, (record[1], record_id))
+        place(self.dates, (record[4], record_id))
+
+    def _sort(self):
+        if self._unsorted:
+            self.sorted_brands.sort()
+            self.prices.sort()
+            self.dates.sort()
+            self._unsorted = False
+
+    def remove(self, record_id):
+        self._sort()
+        record = self.records.pop(record_id, None)
+        if record is None:
+            return
+        brand_key = record[0]
+        self.brands[brand_key].discard(record_id)
+        if not self.brands[brand_key]:
+            del self.brands[brand_key]
+            del self.sorted_brands[bisect_left(self.sorted_brands, brand_key)]
+            for gram in trigrams(brand_key):
+                self.trigrams[gram].discard(brand_key)
+                if not self.trigrams[gram]:
+                    del self.trigrams[gram]
+        self._discard(self.services, record[3], record_id)
+        self._discard(self.categories, record[2], record_id)
+        if record[1] is not None:
+            del self.prices[bisect_left(self.prices, (record[1], record_id))]
+        del self.dates[bisect_left(self.dates, (record[4], record_id))]
+
+    def update(self, row, record_id):
+        self.remove(record_id)
+        self.add(row, record_id)
+
+    def _discard(self, buckets, key, record_id):
+        bucket = buckets.get(key)
+        if bucket is not None:
+            bucket.discard(record_id)
+            if not bucket:
+                del buckets[key]
+
+    def matching_brands(self, text):
+        self._sort()
+        if len(text) < 3:
+            # Too short for trigrams; treat it as a prefix
+            start = bisect_left(self.sorted_brands, text)
+            found = []
+            for brand_key in self.sorted_brands[start:]:
+                if not brand_key.startswith(text):
+                    break
+                found.append(brand_key)
+            return found
+
+        grams = sorted((self.trigrams.get(gram, set()) for gram in trigrams(text)), key=len)
+        candidates = set(grams[0]).intersection(*grams[1:])
+        return [brand_key for brand_key in candidates if text in brand_key]
+
+    def search(self, query):
+        # Starts from the smallest exact source, a set of IDs or a slice of
+        # a sorted list, and intersects the others into it: sets directly,
+        # slices as sets when they are not much bigger than the result so
+        # far, otherwise by comparing that one field per remaining record
+        self._sort()
+        sets = []
+        if query.text:
+            sets.append(set().union(*(self.brands[b] for b in self.matching_brands(query.text))))
+        if query.service:
+            sets.append(self.services.get(query.service, set()))
+        if query.category:
+            sets.append(self.categories.get(query.category, set()))
+
+        slices = []
+        if query.min_price is not None or query.max_price is not None:
+            low = (query.min_price,) if query.min_price is not None else None
+            high = (query.max_price, HIGHEST) if query.max_price is not None else None
+            slices.append(self._bounds(self.prices, low, high, 1))
+        if query.date_from or query.date_to:
+            slices.append(self._bounds(self.dates, *date_bounds(query.date_from, query.date_to), 4))
+
+        if not sets and not slices:
+            return set(self.records)
+        sets.sort(key=len)
+        slices.sort(key=lambda bounds: bounds[2] - bounds[1])
+        if slices and (not sets or slices[0][2] - slices[0][1] < len(sets[0])):
+            pairs, start, end, _, _, _ = slices.pop(0)
+            result = set(map(itemgetter(1), pairs[start:end]))
+        else:
+            result = set(sets.pop(0))
+        for record_ids in sets:
+            result &= record_ids
+        for pairs, start, end, low, high, field in slices:
+            if end - start <= 4 * len(result):
+                result &= set(map(itemgetter(1), pairs[start:end]))
+            else:
+                records = self.records
+                result = {record_id for record_id in result
+                          if self._within((records[record_id][field], record_id), low, high)}
+        return result
+
+    def _bounds(self, pairs, low, high, field):
+        # (pairs, start, end, low, high, field): pairs[start:end] are the
+        # records whose field lies within the bounds
+        start = bisect_left(pairs, low) if low is not None else 0
+        end = bisect_left(pairs, high) if high is not None else len(pairs)
+        return pairs, start, end, low, high, field
+
+    def _within(self, pair, low, high):
+        # Same test as the slice from _bounds, for one record
+        if pair[0] is None:
+            return False
+        return (low is None or pair >= low) and (high is None or pair < high)
+
+    def matches(self, record_id, query):
+        record = self.records.get(record_id)
+        if record is None:
+            return False
+        return record_matches(record, query)
+
+    def filter(self, record_ids, query):
+        # Incremental path: narrow an existing result list, keeping its order
+        return [record_id for record_id in record_ids if self.matches(record_id, query)]
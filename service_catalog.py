@@ -0,0 +1,121 @@
+import json
+import os
+import tempfile
+
+from file_mode import keep_mode
+
+# What a new price list starts with; afterwards the sidecar file is the
+# source of truth and shops can add their own service types
+DEFAULT_SERVICES = {
+    "5 Year Battery": ["Category 1", "Category 2", "Category 3", "Category 4", "Category 5"],
+    "Lifetime Battery": ["Category 1", "Category 2", "Category 3", "Category 4", "Category 5"],
+    "Band Adjustment": ["Basic", "Mid-Range", "High-End"],
+    "Overhaul": ["Basic Service", "Full Service", "Complete Restoration"],
+}
+
+
+class ServiceCatalog:
+    # The service types and the categories offered for each, kept next to
+    # the price list in <file>.services.json:
+    #
+    #   {"services": {"Overhaul": ["Basic Service", "Full Service"], ...}}
+    #
+    # The file is read once; each service's sorted category tuple is cached,
+    # so switching service types is a dictionary lookup. Changes are saved
+    # straight away (temp file and rename, like the workbook).
+
+    def __init__(self, path):
+        self.path = path
+        self._services = {}  # service type -> sorted tuple of categories
+
+    def load(self, create=True):
+        # A missing file is created with the defaults, ready to be edited,
+        # unless create is false.
+        # A file that cannot be read raises OSError, one that is not a
+        # catalog ValueError; use_defaults() is the fallback for both.
+        if not os.path.exists(self.path):
+            self.use_defaults()
+            if create:
+                self.save()
+            return self
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        services = data.get("services") if isinstance(data, dict) else None
+        if not isinstance(services, dict) or not all(isinstance(categories, list)
+                                                     for categories in services.values()):
+            raise ValueError(f"{self.path} is not a service catalog")
+        self._services = {str(name): self._sorted(categories) for name, categories in services.items()}
+        return self
+
+    def use_defaults(self):
+        # In memory only; the file is written on the next change
+        self._services = {name: self._sorted(categories) for name, categories in DEFAULT_SERVICES.items()}
+        return self
+
+    def merge(self, pairs):
+        # Adds the (service type, category) pairs that are missing, such as
+        # those of entries made before the catalog existed. Returns whether
+        # anything was added.
+        missing = {}
+        for service_type, category in pairs:
+            service_type, category = str(service_type), str(category)
+            if service_type and category and category not in self._services.get(service_type, ()):
+                missing.setdefault(service_type, []).append(category)
+        if not missing:
+            return False
+        for service_type, categories in missing.items():
+            self._services[service_type] = self._sorted(self._services.get(service_type, ()) + tuple(categories))
+        self.save()
+        return True
+
+    def _sorted(self, categories):
+        return tuple(sorted({str(category) for category in categories}, key=str.casefold))
+
+    def services(self):
+        return list(self._services)
+
+    def categories(self, service_type):
+        return self._services.get(service_type, ())
+
+    def add_service(self, service_type, categories=()):
+        service_type = service_type.strip()
+        if not service_type:
+            raise ValueError("Please enter a service type name")
+        if service_type in self._services:
+            raise ValueError(f"Service type {service_type} already exists")
+        self._services[service_type] = self._sorted(categories)
+        self.save()
+
+    def remove_service(self, service_type):
+        if self._services.pop(service_type, None) is not None:
+            self.save()
+
+    def add_category(self, service_type, category):
+        category = category.strip()
+        if not category:
+            raise ValueError("Please enter a category name")
+        current = self._services.get(service_type, ())
+        if category in current:
+            raise ValueError("Category already exists!")
+        self._services[service_type] = self._sorted(current + (category,))
+        self.save()
+
+    def remove_category(self, service_type, category):
+        current = self._services.get(service_type, ())
+        if category in current:
+            self._services[service_type] = tuple(name for name in current if name != category)
+            self.save()
+
+    def save(self):
+        data = {"services": {name: list(categories) for name, categories in self._services.items()}}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(suffix=".json", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+            keep_mode(tmp_path, self.path)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
@@ -0,0 +1,106 @@
+import marshal
+import os
+import tempfile
+
+from file_mode import keep_mode
+
+CACHE_FORMAT = 3
+UNKNOWN = object()
+
+
+def as_read(value):
+    # The value openpyxl gives back for one we write: numbers go through
+    # "%.16g" (so 25.0 comes back as 25) and empty strings become empty
+    # cells. UNKNOWN for anything else, which is not worth predicting.
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        text = "%.16g" % value
+        if text in ("nan", "inf", "-inf"):
+            return None
+        if "." in text or "e" in text:
+            return float(text)
+        return int(text)
+    return UNKNOWN
+
+
+class SnapshotCache:
+    # The rows of the workbook as last parsed, in one marshal file next to
+    # it (<file>.cache), keyed by the workbook's modification time and size.
+    # An unchanged workbook is read back from here without parsing any XML;
+    # any other signature, or a cache that is missing, torn or from another
+    # format, is a miss and the workbook is parsed as usual.
+    #
+    # Rows holding values marshal cannot store (dates typed in Excel, for
+    # instance) are not cached. Alongside the rows it keeps whether the
+    # workbook holds anything besides them (see ExcelBackend).
+
+    def __init__(self, path):
+        self.path = path
+
+    def get(self, signature):
+        if signature is None:
+            return None
+        try:
+            # One read; marshal.load on the file would read value by value
+            with open(self.path, "rb") as f:
+                cached = marshal.loads(f.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(cached, tuple) or len(cached) != 4:
+            return None
+        cache_format, cached_signature, rows, plain = cached
+        if cache_format != CACHE_FORMAT or cached_signature != signature:
+            return None
+        return rows, plain
+
+    def put(self, signature, rows, plain=False):
+        # Best effort; a cache that cannot be written just means parsing
+        # the workbook next time
+        # Repeated strings (categories, service types) share one object,
+        # which marshal then stores once
+        strings = {}
+        rows = tuple(tuple(strings.setdefault(value, value) if isinstance(value, str) else value
+                           for value in row)
+                     for row in rows)
+        try:
+            data = marshal.dumps((CACHE_FORMAT, tuple(signature), rows, bool(plain)))
+        except ValueError:
+            self.clear()
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(suffix=".cache", dir=directory)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                keep_mode(tmp_path, self.path)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        except OSError:
+            pass
+
+    def put_written(self, signature, rows, plain=False):
+        # Caches rows we have just written as they will read back
+        read_rows = []
+        for row in rows:
+            read_row = []
+            for value in row:
+                value = as_read(value)
+                if value is UNKNOWN:
+                    self.clear()
+                    return
+                read_row.append(value)
+            read_rows.append(read_row)
+        self.put(signature, read_rows, plain)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,84 @@
+from bisect import bisect_left, insort
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+COLUMNS = ("Brand", "Price", "Category", "Service", "Date")
+
+
+def text_key(value):
+    return (0, str(value).casefold()) if value not in (None, "") else (1,)
+
+
+def price_key(value):
+    try:
+        price = Decimal(str(value).replace('$', ''))
+    except InvalidOperation:
+        return (1,)
+    return (0, price) if price.is_finite() else (1,)
+
+
+def date_key(value):
+    if isinstance(value, datetime):
+        return (0, value)
+    try:
+        return (0, datetime.strptime(str(value), "%Y-%m-%d %H:%M"))
+    except ValueError:
+        return (1, str(value or ""))
+
+
+def sort_keys(row):
+    # One typed key per column; blanks and unparsable values sort last
+    return (text_key(row[0]), price_key(row[1]), text_key(row[2]), text_key(row[3]), date_key(row[4]))
+
+
+class SortCache:
+    # Sort keys are computed once per record. The first sort on a column
+    # builds a sorted list of (key, record ID) pairs, which is then kept up
+    # to date on every add, update and remove, so clicking a heading again
+    # or flipping the direction is a copy or reversal rather than a re-sort.
+
+    def __init__(self):
+        self.keys = {}    # record ID -> sort_keys(row)
+        self.orders = {}  # column index -> sorted [(key, record ID)]
+
+    def add(self, row, record_id):
+        keys = sort_keys(row)
+        self.keys[record_id] = keys
+        for column, pairs in self.orders.items():
+            insort(pairs, (keys[column], record_id))
+
+    def remove(self, record_id):
+        keys = self.keys.pop(record_id, None)
+        if keys is None:
+            return
+        for column, pairs in self.orders.items():
+            del pairs[bisect_left(pairs, (keys[column], record_id))]
+
+    def update(self, row, record_id):
+        self.remove(record_id)
+        self.add(row, record_id)
+
+    def order(self, column, descending=False):
+        pairs = self.orders.get(column)
+        if pairs is None:
+            pairs = sorted((keys[column], record_id) for record_id, keys in self.keys.items())
+            self.orders[column] = pairs
+        record_ids = [record_id for _, record_id in pairs]
+        if descending:
+            record_ids.reverse()
+        return record_ids
+
+    def insert_position(self, record_ids, record_id, column, descending=False):
+        # Binary search for where record_id belongs in a list already sorted
+        # on column, such as a filtered slice of order(column, descending)
+        target = (self.keys[record_id][column], record_id)
+        low, high = 0, len(record_ids)
+        while low < high:
+            middle = (low + high) // 2
+            probe = record_ids[middle]
+            current = (self.keys[probe][column], probe)
+            if (current > target) if descending else (current < target):
+                low = middle + 1
+            else:
+                high = middle
+        return low
@@ -0,0 +1,424 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import uuid
+
+from file_mode import keep_mode
+from snapshot_cache import SnapshotCache
+
+HEADERS = ["Brand", "Price", "Category", "Service Type", "Date Added"]
+SHEET_TITLE = "Watch_Services"
+ID_HEADER = "ID"
+ID_COLUMN = len(HEADERS)  # Zero-based; the ID lives after the five data columns
+
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+
+def new_record_id():
+    return uuid.uuid4().hex
+
+
+def duplicate_key(brand, service_type):
+    return (str(brand).casefold(), service_type)
+
+
+def usable_row(row):
+    # Rows without a brand or with fewer than the five data cells are not
+    # entries; they are left in the file as they are
+    return len(row) >= len(HEADERS) and bool(row[0])
+
+
+def id_position(header):
+    # Zero-based column headed ID, or None; older files have none and may
+    # use the columns after the data for their own notes
+    for position in range(ID_COLUMN, len(header)):
+        if header[position] is not None and str(header[position]).strip() == ID_HEADER:
+            return position
+    return None
+
+
+def entry_row(row, position):
+    # A usable row from the file as five data cells and the ID (None when
+    # the file has no ID column)
+    record_id = row[position] if position is not None and position < len(row) else None
+    return tuple(row[:ID_COLUMN]) + (record_id,)
+
+
+# Backends share one small interface used by PriceStore:
+#   create()                 make an empty file if there is none yet
+#   read()                   (total_rows or 0, iterator of row tuples); usable
+#                            rows come as five data cells and the ID, others
+#                            as they are
+#   write(changes, rows)     persist pending changes; rows is the full
+#                            snapshot when the backend sets full_snapshot
+#                            and None otherwise
+#   signature()              cheap value that changes whenever the stored
+#                            data does, for spotting other instances' saves
+#   close()
+# and these attributes: flush_delay, the default pause before a write,
+# uses_journal, whether PriceStore should keep a change journal in front of
+# the slow writes, new_ids, the IDs the last read() made up for rows that
+# had none in the file (to be saved), and read_only, set by PriceStore when
+# read() must not write anything either.
+# Each change is (action, record ID, row) with action "add", "update" or
+# "remove" (row is None for removals).
+
+
+def open_backend(path):
+    if path.lower().endswith(SQLITE_EXTENSIONS):
+        return SqliteBackend(path)
+    return ExcelBackend(path)
+
+
+def write_workbook(path, rows, with_ids=True):
+    # Builds the Watch_Services sheet in write-only mode, saves it to a temp
+    # file next to path and renames it into place
+    # openpyxl takes a good part of startup to import, so it is only loaded
+    # once a workbook is actually read or written
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    wb = openpyxl.Workbook(write_only=True)
+    sheet = wb.create_sheet(SHEET_TITLE)
+    header = []
+    for title in HEADERS + ([ID_HEADER] if with_ids else []):
+        cell = WriteOnlyCell(sheet, value=title)
+        cell.font = Font(bold=True)
+        header.append(cell)
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row if with_ids else row[:ID_COLUMN])
+    save_workbook(wb, path)
+
+
+def update_workbook(path, rows, skipped=(), lines=None):
+    # Writes rows (five data cells and the ID) into the price sheet of the
+    # existing workbook instead of building a new one, so its other sheets,
+    # column widths and cell formats stay; several times slower than
+    # write_workbook. The ID goes in the column headed ID, which is added
+    # after the last used column if there is none. The sheet's other
+    # columns stay with their row: matched by ID, or for IDs not in the
+    # sheet yet by lines (record ID -> sheet row). skipped rows are written
+    # back as they are. Returns whether the result holds nothing
+    # write_workbook would drop.
+    import openpyxl
+
+    wb = openpyxl.load_workbook(path)
+    sheet = wb.active
+    position = id_position([cell.value for cell in sheet[1]])
+    if position is None:
+        position = max(sheet.max_column, ID_COLUMN)
+        sheet.cell(row=1, column=position + 1).value = ID_HEADER
+    width = max(sheet.max_column, position + 1)
+    lines = lines or {}
+    by_line = {}  # sheet row -> its cells
+    by_id = {}    # record ID -> cells of the first row with it
+    for line, cells in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
+        by_line[line] = cells
+        if usable_row(cells):
+            record_id = entry_row(cells, position)[ID_COLUMN]
+            if record_id is not None:
+                by_id.setdefault(str(record_id), cells)
+
+    def cells_of(row):
+        record_id = row[ID_COLUMN]
+        if record_id in lines:
+            cells = by_line.get(lines[record_id], ())
+        else:
+            cells = by_id.get(str(record_id), ())
+        values = list(cells) + [None] * (width - len(cells))
+        values[:ID_COLUMN] = row[:ID_COLUMN]
+        values[position] = row[ID_COLUMN]
+        return values
+
+    count = 0
+    for count, values in enumerate([cells_of(row) for row in rows] + [list(row) for row in skipped], start=1):
+        values.extend([None] * (width - len(values)))
+        for column, value in enumerate(values, start=1):
+            sheet.cell(row=count + 1, column=column).value = value
+    if sheet.max_row > count + 1:
+        sheet.delete_rows(count + 2, sheet.max_row - count - 1)
+    plain = plain_workbook(wb)
+    save_workbook(wb, path)
+    return plain
+
+
+def plain_workbook(wb):
+    # Whether write_workbook would reproduce wb: the one price sheet with
+    # its headers, values only and the default layout
+    sheet = wb.active
+    if len(wb.sheetnames) != 1 or wb.defined_names or sheet.defined_names:
+        return False
+    if sheet.title != SHEET_TITLE or [cell.value for cell in sheet[1]] != HEADERS + [ID_HEADER]:
+        return False
+    if (sheet.merged_cells.ranges or sheet.conditional_formatting or sheet.data_validations.dataValidation
+            or sheet.tables or sheet._images or sheet._charts or sheet.freeze_panes or sheet.auto_filter.ref):
+        return False
+    if any(dimension.customWidth or dimension.hidden for dimension in sheet.column_dimensions.values()):
+        return False
+    if any(dimension.customHeight or dimension.hidden for dimension in sheet.row_dimensions.values()):
+        return False
+    return not any(cell.has_style for cells in sheet.iter_rows(min_row=2) for cell in cells)
+
+
+def save_workbook(wb, path):
+    # Write next to the target so the rename stays on one filesystem
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(suffix=".xlsx", dir=directory)
+    os.close(fd)
+    try:
+        wb.save(tmp_path)
+        keep_mode(tmp_path, path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def export_workbook(path, rows):
+    # Plain five-column layout for downstream spreadsheets, without IDs
+    write_workbook(path, rows, with_ids=False)
+
+
+def read_workbook(path):
+    import openpyxl
+
+    # (total_rows, header row, iterator of the rows below it)
+    wb = openpyxl.load_workbook(path, read_only=True)
+    sheet = wb.active
+    total_rows = max((sheet.max_row or 1) - 1, 0)
+    cells = sheet.iter_rows(values_only=True)
+    try:
+        header = next(cells, ())
+    except BaseException:
+        wb.close()
+        raise
+
+    def rows():
+        try:
+            for row in cells:
+                yield row
+        finally:
+            wb.close()
+
+    return total_rows, header, rows()
+
+
+class ExcelBackend:
+    # The workbook is the database; every write saves a full snapshot, so
+    # edits go to the journal first and are compacted in here periodically.
+    # Rows are read as read() hands them out, with the ID taken from the
+    # column headed ID only, and kept in a snapshot cache, so opening a
+    # workbook that has not changed since skips the XML.
+    #
+    # A snapshot is written from scratch in write-only mode only while the
+    # file is known to hold nothing else (we wrote it that way and nobody
+    # has saved it since). Otherwise, the first save of a workbook from
+    # Excel for instance, it goes through update_workbook so other sheets,
+    # column widths and formats survive. Rows that are not entries are
+    # written back after the entries either way.
+    flush_delay = 30.0
+    full_snapshot = True
+    uses_journal = True
+
+    def __init__(self, path):
+        self.path = path
+        self.cache = SnapshotCache(path + ".cache")
+        self.skipped = []  # rows of the last read that are not entries
+        self.new_ids = {}  # record ID made up by the last read -> its sheet row, until written
+        self.read_only = False
+        self._plain = None  # signature of the file while it holds only what write_workbook writes
+
+    def create(self):
+        if not os.path.exists(self.path):
+            import openpyxl
+            from openpyxl.styles import Font
+
+            wb = openpyxl.Workbook()
+            sheet = wb.active
+            sheet.title = SHEET_TITLE
+            sheet.append(HEADERS + [ID_HEADER])
+            for col in range(1, len(HEADERS) + 2):
+                sheet.cell(row=1, column=col).font = Font(bold=True)
+            wb.save(self.path)
+
+    def read(self):
+        signature = self.signature()
+        cached = self.cache.get(signature)
+        if cached is not None:
+            rows, plain = cached
+            self._plain = signature if plain else None
+            return len(rows), self._reading(rows)
+        total_rows, header, rows = read_workbook(self.path)
+        return total_rows, self._reading(rows, signature, id_position(header))
+
+    def _reading(self, rows, signature=None, position=None):
+        # Passes the rows through, entries as entry_row() makes them and
+        # keeping the others for write(). Entries without an ID, or with one
+        # an earlier row has, get a new one tied to their sheet row until it
+        # is written. Freshly parsed rows (signature given) are cached as
+        # they are in the file once all have been read, unless the workbook
+        # was saved again meanwhile.
+        parsed = []
+        skipped = []
+        new_ids = {}
+        seen = set()
+        for line, row in enumerate(rows, start=2):
+            if signature is not None:
+                if usable_row(row):
+                    row = entry_row(row, position)
+                parsed.append(row)
+            if usable_row(row):
+                record_id = row[ID_COLUMN]
+                if not record_id or str(record_id) in seen:
+                    record_id = new_record_id()
+                    new_ids[record_id] = line
+                    row = tuple(row[:ID_COLUMN]) + (record_id,)
+                seen.add(str(record_id))
+            elif any(value is not None for value in row):
+                skipped.append(row)
+            yield row
+        self.skipped = skipped
+        self.new_ids = new_ids
+        if signature is not None and not self.read_only and self.signature() == signature:
+            self.cache.put(signature, parsed)
+
+    def write(self, changes, rows):
+        signature = self.signature()
+        if signature is None or signature == self._plain:
+            write_workbook(self.path, rows + self.skipped)
+            plain = True
+        else:
+            plain = update_workbook(self.path, rows, self.skipped, self.new_ids)
+        self.new_ids = {}
+        signature = self.signature()
+        self._plain = signature if plain else None
+        # What we just wrote is what the next load would read
+        self.cache.put_written(signature, rows + self.skipped, plain)
+
+    def signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def close(self):
+        pass
+
+
+class SqliteBackend:
+    # Rows live in one indexed table, so each change is a single-row
+    # statement instead of a workbook rewrite. A workbook with the same name
+    # next to a new database is imported the first time it is opened.
+    flush_delay = 0.05
+    full_snapshot = False
+    uses_journal = False
+
+    def __init__(self, path):
+        self.path = path
+        self.new_ids = {}  # rows always have their ID here
+        self.read_only = False
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        return self._conn
+
+    def create(self):
+        with self._lock:
+            conn = self._connect()
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='watch_services'"
+            ).fetchone()
+            if exists:
+                return
+            with conn:
+                conn.execute(
+                    "CREATE TABLE watch_services ("
+                    " id TEXT PRIMARY KEY,"
+                    " brand TEXT NOT NULL,"
+                    " price REAL,"
+                    " category TEXT,"
+                    " service_type TEXT,"
+                    " date_added TEXT)"
+                )
+                conn.execute("CREATE INDEX idx_brand ON watch_services (brand COLLATE NOCASE)")
+                conn.execute("CREATE INDEX idx_service_type ON watch_services (service_type)")
+                conn.execute("CREATE INDEX idx_date_added ON watch_services (date_added)")
+
+                workbook = os.path.splitext(self.path)[0] + ".xlsx"
+                if os.path.exists(workbook):
+                    self._import(conn, workbook)
+
+    def _import(self, conn, workbook):
+        _, header, rows = read_workbook(workbook)
+        position = id_position(header)
+        seen = set()
+        records = []
+        for row in rows:
+            if usable_row(row):
+                record_id = entry_row(row, position)[ID_COLUMN]
+                if not record_id or str(record_id) in seen:
+                    record_id = new_record_id()
+                seen.add(str(record_id))
+                records.append(self._params(str(record_id), row))
+        conn.executemany(
+            "INSERT INTO watch_services (id, brand, price, category, service_type, date_added)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            records
+        )
+
+    def _params(self, record_id, row):
+        date_added = row[4]
+        return (record_id, row[0], row[1], row[2], row[3], str(date_added) if date_added is not None else None)
+
+    def read(self):
+        with self._lock:
+            conn = self._connect()
+            total_rows = conn.execute("SELECT COUNT(*) FROM watch_services").fetchone()[0]
+            rows = conn.execute(
+                "SELECT brand, price, category, service_type, date_added, id"
+                " FROM watch_services ORDER BY rowid"
+            ).fetchall()
+        return total_rows, iter(rows)
+
+    def write(self, changes, rows):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                for action, record_id, row in changes:
+                    if action == "remove":
+                        conn.execute("DELETE FROM watch_services WHERE id = ?", (record_id,))
+                    elif action == "add":
+                        conn.execute(
+                            "INSERT OR REPLACE INTO watch_services"
+                            " (id, brand, price, category, service_type, date_added)"
+                            " VALUES (?, ?, ?, ?, ?, ?)",
+                            self._params(record_id, row)
+                        )
+                    else:
+                        params = self._params(record_id, row)
+                        conn.execute(
+                            "UPDATE watch_services SET brand = ?, price = ?, category = ?,"
+                            " service_type = ?, date_added = ? WHERE id = ?",
+                            params[1:] + params[:1]
+                        )
+
+    def signature(self):
+        # Only moves when another connection commits, which is all we need
+        with self._lock:
+            return self._connect().execute("PRAGMA data_version").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,129 @@
+import math
+from bisect import bisect_left, insort
+
+from search_index import index_record
+
+
+class Aggregate:
+    # Count, sum, min, max and median for one group of entries. Prices are
+    # held in whole cents, so the running sum never drifts, in a sorted list
+    # that gives min, max and median by position and stays right on removal.
+    # Bulk adds append and the list is sorted when it is next needed.
+
+    def __init__(self):
+        self.count = 0
+        self.brands = {}  # casefolded brand -> number of entries
+        self.cents = []   # sorted prices in cents, entries with a price only
+        self.total = 0
+        self._unsorted = False
+
+    def add(self, brand, cents, bulk=False):
+        self.count += 1
+        self.brands[brand] = self.brands.get(brand, 0) + 1
+        if cents is not None:
+            if bulk or self._unsorted:
+                self.cents.append(cents)
+                self._unsorted = True
+            else:
+                insort(self.cents, cents)
+            self.total += cents
+
+    def _sorted(self):
+        if self._unsorted:
+            self.cents.sort()
+            self._unsorted = False
+        return self.cents
+
+    def remove(self, brand, cents):
+        self._sorted()
+        self.count -= 1
+        if self.brands[brand] == 1:
+            del self.brands[brand]
+        else:
+            self.brands[brand] -= 1
+        if cents is not None:
+            del self.cents[bisect_left(self.cents, cents)]
+            self.total -= cents
+
+    def sum(self):
+        return self.total / 100
+
+    def mean(self):
+        return self.total / len(self.cents) / 100 if self.cents else None
+
+    def min(self):
+        return self._sorted()[0] / 100 if self.cents else None
+
+    def max(self):
+        return self._sorted()[-1] / 100 if self.cents else None
+
+    def median(self):
+        cents = self._sorted()
+        if not cents:
+            return None
+        middle = len(cents) // 2
+        if len(cents) % 2:
+            return cents[middle] / 100
+        return (cents[middle - 1] + cents[middle]) / 200
+
+
+def price_cents(price):
+    if price is None or not math.isfinite(price):
+        return None
+    return round(price * 100)
+
+
+class SummaryIndex:
+    # Aggregates per service type, per category and per (service type,
+    # category), kept up to date on every add, update and remove instead of
+    # being recomputed from the rows. Each edit touches three groups.
+
+    def __init__(self):
+        self.records = {}     # record ID -> (brand key, cents, category, service)
+        self.overall = Aggregate()
+        self.services = {}    # service type -> Aggregate
+        self.categories = {}  # category -> Aggregate
+        self.groups = {}      # (service type, category) -> Aggregate
+        self.version = 0      # bumped on every change, so a display knows when to redraw
+
+    def _aggregates(self, category, service_type, create):
+        if create:
+            return (
+                self.overall,
+                self.services.setdefault(service_type, Aggregate()),
+                self.categories.setdefault(category, Aggregate()),
+                self.groups.setdefault((service_type, category), Aggregate()),
+            )
+        return (self.overall, self.services[service_type], self.categories[category],
+                self.groups[(service_type, category)])
+
+    def add(self, row, record_id, bulk=False):
+        brand, price, category, service_type, _ = index_record(row)
+        cents = price_cents(price)
+        self.records[record_id] = (brand, cents, category, service_type)
+        self.version += 1
+        for aggregate in self._aggregates(category, service_type, create=True):
+            aggregate.add(brand, cents, bulk)
+
+    def add_many(self, rows):
+        # rows are (row, record ID) pairs, as loaded; sorted once on first use
+        for row, record_id in rows:
+            self.add(row, record_id, bulk=True)
+
+    def remove(self, record_id):
+        record = self.records.pop(record_id, None)
+        if record is None:
+            return
+        brand, cents, category, service_type = record
+        self.version += 1
+        for aggregate in self._aggregates(category, service_type, create=False):
+            aggregate.remove(brand, cents)
+        # Drop groups that have emptied so they leave the summary
+        for groups, key in ((self.services, service_type), (self.categories, category),
+                            (self.groups, (service_type, category))):
+            if not groups[key].count:
+                del groups[key]
+
+    def update(self, row, record_id):
+        self.remove(record_id)
+        self.add(row, record_id)
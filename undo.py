@@ -0,0 +1,159 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from storage import ID_COLUMN
+
+
+class UndoStep:
+    def __init__(self, label):
+        self.label = label
+        self.edits = []    # (record ID, row before or None, row after or None)
+        self.actions = []  # (undo callable, redo callable) for changes outside the store
+        self.time = time.monotonic()
+
+    def record_ids(self):
+        return {record_id for record_id, _, _ in self.edits}
+
+
+class UndoStack:
+    # Undo and redo for everything that changes the price list. The store
+    # reports each batch of edits as (record ID, before, after) rows; other
+    # changes, such as adding a category, are pushed as undo/redo callables.
+    #
+    # Edits made inside group() form one step labelled for the Undo and
+    # Redo buttons, and an edit to the same entries as the step before it
+    # within merge_window seconds joins that step, so retyping a price a few
+    # times is one undo. Undoing or redoing
+    # any number of steps goes to the store as one batch and therefore one
+    # save. At most `depth` steps are kept.
+    #
+    # Steps that touch an entry someone else has since changed are dropped,
+    # so undo never writes an old row over their newer one.
+
+    def __init__(self, store, depth=100, merge_window=2.0):
+        self.store = store
+        self.merge_window = merge_window
+        self.undo_steps = deque(maxlen=depth)
+        self.redo_steps = deque(maxlen=depth)
+        self._group = None
+        self._applying = False
+        store.listeners.append(self.record)
+        store.remote_listeners.append(self.forget)
+
+    def can_undo(self):
+        return bool(self.undo_steps)
+
+    def can_redo(self):
+        return bool(self.redo_steps)
+
+    def undo_label(self):
+        return self.undo_steps[-1].label if self.undo_steps else None
+
+    def redo_label(self):
+        return self.redo_steps[-1].label if self.redo_steps else None
+
+    @contextmanager
+    def group(self, label):
+        if self._group is not None:
+            yield
+            return
+        self._group = UndoStep(label)
+        try:
+            yield
+        finally:
+            step, self._group = self._group, None
+            if step.edits or step.actions:
+                self._add(step)
+
+    def record(self, edits, label="Edit"):
+        # Store listener; also the way to push edits made some other way
+        if self._applying:
+            return
+        if self._group is not None:
+            self._group.edits.extend(edits)
+            return
+        step = UndoStep(label)
+        step.edits.extend(edits)
+        self._add(step)
+
+    def _add(self, step):
+        # Pushes step, or merges it into the top step (see above)
+        top = self.undo_steps[-1] if self.undo_steps else None
+        if (top is not None and not top.actions and not step.actions
+                and step.time - top.time <= self.merge_window
+                and step.record_ids() == top.record_ids()):
+            top.edits.extend(step.edits)
+            top.time = step.time
+            self.redo_steps.clear()
+            return
+        self._push(step)
+
+    def forget(self, record_ids):
+        # Remote listener
+        record_ids = set(record_ids)
+        for steps in (self.undo_steps, self.redo_steps):
+            kept = [step for step in steps if record_ids.isdisjoint(step.record_ids())]
+            if len(kept) != len(steps):
+                steps.clear()
+                steps.extend(kept)
+
+    def push_action(self, label, undo, redo):
+        if self._group is not None:
+            self._group.actions.append((undo, redo))
+            return
+        step = UndoStep(label)
+        step.actions.append((undo, redo))
+        self._push(step)
+
+    def _push(self, step):
+        self.undo_steps.append(step)
+        self.redo_steps.clear()
+
+    def undo(self, steps=1):
+        # Returns (added, updated, removed) record IDs for the caller to redraw
+        return self._move(self.undo_steps, self.redo_steps, steps, backwards=True)
+
+    def redo(self, steps=1):
+        return self._move(self.redo_steps, self.undo_steps, steps, backwards=False)
+
+    def _move(self, source, target, steps, backwards):
+        moved = []
+        while source and len(moved) < steps:
+            moved.append(source.pop())
+        if not moved:
+            return [], [], []
+
+        # Net effect per record across all the steps, so each entry is
+        # written once however many times it changed
+        wanted = {}  # record ID -> row it should end up as (None if gone)
+        # (undo takes the newest step first, redo the oldest)
+        edits = [edit for step in moved for edit in (reversed(step.edits) if backwards else step.edits)]
+        for record_id, before, after in edits:
+            wanted[record_id] = before if backwards else after
+
+        updates, removes, restores = [], [], []
+        for record_id, row in wanted.items():
+            exists = record_id in self.store.positions
+            if row is None:
+                if exists:
+                    removes.append(record_id)
+            elif exists:
+                updates.append((record_id, row[:ID_COLUMN]))
+            else:
+                restores.append(row)
+
+        self._applying = True
+        try:
+            # Steps of actions only, such as adding a category, leave the
+            # store (and the file) alone
+            if updates or removes or restores:
+                self.store.apply(updates=updates, removes=removes, restores=restores)
+            for step in moved:
+                for undo, redo in (reversed(step.actions) if backwards else step.actions):
+                    (undo if backwards else redo)()
+        finally:
+            self._applying = False
+        for step in moved:
+            target.append(step)
+        return ([row[ID_COLUMN] for row in restores], [record_id for record_id, _ in updates], removes)
@@ -0,0 +1,148 @@
+import tkinter as tk
+from tkinter import ttk
+
+
+class VirtualTable:
+    # A Treeview that only holds the rows currently on screen. The full view
+    # is a list of record IDs; rows are rendered from fetch(record_id) as the
+    # user scrolls, so Tk never holds more than a page of items however
+    # large the price list grows. Record IDs are used as the Treeview iids,
+    # which keeps selection mapped back to the underlying record.
+
+    def __init__(self, parent, columns, fetch, on_select=None):
+        self.fetch = fetch
+        self.on_select = on_select
+        self.ids = []
+        self.offset = 0
+        self.page_size = 20
+        self.selected = None
+
+        self.tree = ttk.Treeview(parent, columns=columns, show="headings", selectmode="browse")
+        self.scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self.yview)
+
+        self.tree.bind('<<TreeviewSelect>>', self.on_tree_select)
+        self.tree.bind('<Configure>', self.on_configure)
+        self.tree.bind('<MouseWheel>', self.on_mouse_wheel)
+        self.tree.bind('<Button-4>', lambda event: self.scroll(-3))
+        self.tree.bind('<Button-5>', lambda event: self.scroll(3))
+        self.tree.bind('<Up>', lambda event: self.move_selection(-1))
+        self.tree.bind('<Down>', lambda event: self.move_selection(1))
+        self.tree.bind('<Prior>', lambda event: self.move_selection(-self.page_size))
+        self.tree.bind('<Next>', lambda event: self.move_selection(self.page_size))
+
+    def set_ids(self, ids, keep_offset=False):
+        self.ids = list(ids)
+        if not keep_offset:
+            self.offset = 0
+        if self.selected not in self.ids:
+            self.selected = None
+        self.render()
+
+    def insert_many(self, index, ids):
+        self.ids[index:index] = ids
+        if index < self.offset:
+            # Keep the rows on screen where they are
+            self.offset += len(ids)
+            self.update_scrollbar()
+        elif index >= self.offset + self.page_size:
+            self.update_scrollbar()
+        else:
+            self.render()
+
+    def insert(self, index, record_id):
+        self.ids.insert(index, record_id)
+        self.render()
+
+    def remove(self, record_id):
+        self.ids.remove(record_id)
+        if self.selected == record_id:
+            self.selected = None
+        self.render()
+
+    def refresh(self):
+        self.render()
+
+    def select(self, record_id):
+        self.selected = record_id
+        self.see(record_id)
+
+    def clear_selection(self):
+        self.selected = None
+        self.tree.selection_remove(*self.tree.selection())
+
+    def see(self, record_id):
+        index = self.ids.index(record_id)
+        if index < self.offset:
+            self.offset = index
+        elif index >= self.offset + self.page_size:
+            self.offset = index - self.page_size + 1
+        self.render()
+
+    def render(self):
+        self.offset = max(0, min(self.offset, len(self.ids) - self.page_size))
+        visible = self.ids[self.offset:self.offset + self.page_size]
+
+        children = self.tree.get_children()
+        if children:
+            self.tree.delete(*children)
+        for record_id in visible:
+            self.tree.insert("", tk.END, iid=record_id, values=self.fetch(record_id))
+
+        if self.selected is not None and self.tree.exists(self.selected):
+            self.tree.selection_set(self.selected)
+        self.update_scrollbar()
+
+    def update_scrollbar(self):
+        total = len(self.ids)
+        if total <= self.page_size:
+            self.scrollbar.set(0, 1)
+        else:
+            self.scrollbar.set(self.offset / total, min(1, (self.offset + self.page_size) / total))
+
+    def yview(self, *args):
+        # Scrollbar protocol: ("moveto", fraction) or ("scroll", n, "units"/"pages")
+        if args[0] == "moveto":
+            self.offset = int(float(args[1]) * len(self.ids))
+            self.render()
+        elif args[0] == "scroll":
+            step = int(args[1])
+            if args[2] == "pages":
+                step *= self.page_size
+            self.scroll(step)
+
+    def scroll(self, rows):
+        self.offset += rows
+        self.render()
+
+    def on_mouse_wheel(self, event):
+        self.scroll(-3 if event.delta > 0 else 3)
+
+    def on_configure(self, event):
+        # Fit the page to the widget height, leaving room for the headings
+        row_height = ttk.Style().lookup("Treeview", "rowheight") or 20
+        page_size = max(1, (event.height - 25) // int(row_height))
+        if page_size != self.page_size:
+            self.page_size = page_size
+            self.render()
+
+    def on_tree_select(self, event):
+        selected = self.tree.selection()
+        # Re-rendering drops and restores the selection; only report real changes
+        if not selected or selected[0] == self.selected:
+            return
+        self.selected = selected[0]
+        if self.on_select:
+            self.on_select(self.selected)
+
+    def move_selection(self, step):
+        if not self.ids:
+            return "break"
+        if self.selected in self.ids:
+            index = self.ids.index(self.selected) + step
+        else:
+            index = self.offset
+        index = max(0, min(index, len(self.ids) - 1))
+        self.select(self.ids[index])
+        if self.on_select:
+            self.on_select(self.selected)
+        return "break"
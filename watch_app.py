@@ -1,9 +1,23 @@
+import sys
+
+if __name__ == "__main__" and len(sys.argv) > 1:
+    # Any arguments mean a headless command, e.g. "add prices.xlsx ...";
+    # handed over before tkinter is imported so it runs without a display
+    from watch_cli import main as cli_main
+    sys.exit(cli_main())
+
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-from datetime import datetime
 import os
-import openpyxl
-from openpyxl.styles import Font
+import queue
+import threading
+
+from price_service import DuplicateEntryError, PriceService
+from search_index import SearchIndex, SearchQuery, parse_price
+from sort_cache import COLUMNS, SortCache
+from storage import ID_COLUMN
+from summary import SummaryIndex
+from virtual_table import VirtualTable
 
 class WatchPricingApp:
     def __init__(self, root):
@@ -21,12 +35,37 @@ class WatchPricingApp:
         self.root.grid_columnconfigure(0, weight=1)
         
         self.selected_item = None
+        self.view_ids = []  # Every record ID in display order, newest additions first
+        self.search_index = SearchIndex()
+        self.query = None
+        self.sort_cache = SortCache()
+        self.summary = SummaryIndex()
+        self.summary_window = None
+        self.sort_column = None  # Index into COLUMNS, or None for entry order
+        self.sort_descending = False
+        self.remote_queue = queue.Queue()
+        self.refreshing = False
+        self.overwritten = 0  # Edits of ours that replaced someone else's in a merge
         self.get_excel_file_location()
         
         if self.excel_file:
+            self.service = PriceService(self.excel_file)
+            self.store = self.service.store
+            try:
+                self.catalog = self.service.catalog.load()
+            except (OSError, ValueError) as e:
+                messagebox.showwarning(
+                    "Service Types",
+                    f"Could not read the service types: {str(e)}\n\n" +
+                    "Using the defaults; the file will be replaced when service types are next changed."
+                )
+                self.catalog = self.service.catalog.use_defaults()
             self.setup_fresh_excel_file()
             self.create_main_interface()
             self.load_existing_data()
+            self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+            self.poll_save_status()
+            self.poll_remote_changes()
         else:
             self.root.destroy()
 
@@ -64,7 +103,7 @@ class WatchPricingApp:
         if response:  # User wants to open existing file
             file_path = filedialog.askopenfilename(
                 title="Select Price Manager File",
-                filetypes=[("Excel files", "*.xlsx")],
+                filetypes=[("Price files", "*.xlsx *.db"), ("Excel files", "*.xlsx"), ("SQLite databases", "*.db")],
                 initialdir=os.path.expanduser("~/Documents")
             )
             if file_path:  # User selected a file
@@ -75,7 +114,7 @@ class WatchPricingApp:
             file_path = filedialog.asksaveasfilename(
                 title="Save Price List As",
                 defaultextension=".xlsx",
-                filetypes=[("Excel files", "*.xlsx")],
+                filetypes=[("Excel files", "*.xlsx"), ("SQLite databases", "*.db")],
                 initialdir=os.path.expanduser("~/Documents"),
                 initialfile="Enter File Name.xlsx"
             )
@@ -84,16 +123,9 @@ class WatchPricingApp:
             else:  # User cancelled file selection
                 self.excel_file = None
     def setup_fresh_excel_file(self):
-        # Only create new file if it doesn't exist
-        if not os.path.exists(self.excel_file):
-            wb = openpyxl.Workbook()
-            headers = ["Brand", "Price", "Category", "Service Type", "Date Added"]
-            sheet = wb.active
-            sheet.title = "Watch_Services"
-            sheet.append(headers)
-            for col in range(1, len(headers) + 1):
-                sheet.cell(row=1, column=col).font = Font(bold=True)
-            wb.save(self.excel_file)
+        # Only creates a new file if it doesn't exist; a new .db imports the
+        # workbook of the same name, if there is one
+        self.store.create()
 
     def create_main_interface(self):
         # Main container frame
@@ -112,18 +144,20 @@ class WatchPricingApp:
         input_frame = ttk.LabelFrame(main_container, text="Add New Entry", padding=10)
         input_frame.pack(fill=tk.X, pady=(0, 10))
 
-        # Service Type Dropdown with Overhaul
+        # Service Type Dropdown; the choices come from the service catalog
         service_frame = ttk.Frame(input_frame)
         service_frame.pack(fill=tk.X, pady=5)
         ttk.Label(service_frame, text="Service Type:").pack(side=tk.LEFT, padx=5)
         self.service_type = ttk.Combobox(
             service_frame,
-            values=["5 Year Battery", "Lifetime Battery", "Band Adjustment", "Overhaul"],
+            values=self.catalog.services(),
             state="readonly",
             width=min(30, self.window_width // 40)
         )
-        self.service_type.set("5 Year Battery")
+        self.service_type.set(self.default_service())
         self.service_type.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+        ttk.Button(service_frame, text="Add Service Type",
+                  command=self.add_new_service).pack(side=tk.RIGHT, padx=5)
 
         # Category Frame with Add Category button
         category_frame = ttk.Frame(input_frame)
@@ -172,17 +206,85 @@ class WatchPricingApp:
         ttk.Button(button_frame, text="Add Entry", command=self.add_entry).pack(side=tk.LEFT, padx=pad_x)
         ttk.Button(button_frame, text="Update Selected", command=self.update_entry).pack(side=tk.LEFT, padx=pad_x)
         ttk.Button(button_frame, text="Remove Selected", command=self.remove_entry).pack(side=tk.LEFT, padx=pad_x)
+        ttk.Button(button_frame, text="Find Duplicates", command=self.show_duplicates).pack(side=tk.LEFT, padx=pad_x)
+        ttk.Button(button_frame, text="Price History", command=self.show_history).pack(side=tk.LEFT, padx=pad_x)
+        ttk.Button(button_frame, text="Summary", command=self.show_summary).pack(side=tk.LEFT, padx=pad_x)
+        ttk.Button(button_frame, text="Import Price List", command=self.import_price_list).pack(side=tk.LEFT, padx=pad_x)
+        ttk.Button(button_frame, text="Bulk Reprice", command=self.bulk_reprice).pack(side=tk.LEFT, padx=pad_x)
+        self.undo_button = ttk.Button(button_frame, text="Undo", command=self.undo, state=tk.DISABLED)
+        self.undo_button.pack(side=tk.LEFT, padx=pad_x)
+        self.redo_button = ttk.Button(button_frame, text="Redo", command=self.redo, state=tk.DISABLED)
+        self.redo_button.pack(side=tk.LEFT, padx=pad_x)
+        self.root.bind_all("<Control-z>", lambda event: self.undo())
+        self.root.bind_all("<Control-y>", lambda event: self.redo())
+        self.root.bind_all("<Control-Z>", lambda event: self.redo())
+        ttk.Button(button_frame, text="Export to Excel", command=self.export_to_excel).pack(side=tk.LEFT, padx=pad_x)
+
+        # Search Frame; filters the entries as the user types
+        search_frame = ttk.LabelFrame(main_container, text="Search", padding=10)
+        search_frame.pack(fill=tk.X, pady=(0, 10))
+
+        search_top = ttk.Frame(search_frame)
+        search_top.pack(fill=tk.X, pady=2)
+        ttk.Label(search_top, text="Brand:").pack(side=tk.LEFT, padx=5)
+        self.search_text = tk.StringVar()
+        ttk.Entry(search_top, textvariable=self.search_text).pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+        ttk.Label(search_top, text="Service:").pack(side=tk.LEFT, padx=5)
+        self.search_service = ttk.Combobox(
+            search_top,
+            values=["All"] + self.catalog.services(),
+            state="readonly",
+            width=18
+        )
+        self.search_service.set("All")
+        self.search_service.pack(side=tk.LEFT, padx=5)
+        ttk.Label(search_top, text="Category:").pack(side=tk.LEFT, padx=5)
+        self.search_category = tk.StringVar()
+        self.search_category_box = ttk.Combobox(
+            search_top,
+            textvariable=self.search_category,
+            postcommand=self.refresh_search_categories,
+            width=18
+        )
+        self.search_category_box.pack(side=tk.LEFT, padx=5)
+
+        search_bottom = ttk.Frame(search_frame)
+        search_bottom.pack(fill=tk.X, pady=2)
+        self.search_min_price = tk.StringVar()
+        self.search_max_price = tk.StringVar()
+        self.search_date_from = tk.StringVar()
+        self.search_date_to = tk.StringVar()
+        for label, var in (("Price from ($):", self.search_min_price), ("to:", self.search_max_price),
+                           ("Date from (YYYY-MM-DD):", self.search_date_from), ("to:", self.search_date_to)):
+            ttk.Label(search_bottom, text=label).pack(side=tk.LEFT, padx=5)
+            ttk.Entry(search_bottom, textvariable=var, width=12).pack(side=tk.LEFT, padx=5)
+        ttk.Button(search_bottom, text="Clear", command=self.clear_filter).pack(side=tk.RIGHT, padx=5)
+
+        for var in (self.search_text, self.search_category, self.search_min_price,
+                    self.search_max_price, self.search_date_from, self.search_date_to):
+            var.trace_add("write", self.apply_filter)
+        self.search_service.bind('<<ComboboxSelected>>', self.apply_filter)
 
         # Tree Frame (responsive)
         tree_frame = ttk.LabelFrame(main_container, text="Entries", padding=10)
         tree_frame.pack(fill=tk.BOTH, expand=True)
 
-        # Create Treeview with dynamic column widths
-        self.tree = ttk.Treeview(
+        # Loading progress, shown only while the workbook is being read
+        self.load_frame = ttk.Frame(tree_frame)
+        self.load_label = ttk.Label(self.load_frame, text="Loading entries...")
+        self.load_label.pack(side=tk.LEFT, padx=5)
+        self.load_progress = ttk.Progressbar(self.load_frame, mode="determinate")
+        self.load_progress.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+
+        # Create Treeview with dynamic column widths; only the visible rows
+        # are held as Tk items, the rest are paged in from the store
+        self.table = VirtualTable(
             tree_frame,
             columns=("Brand", "Price", "Category", "Service", "Date"),
-            show="headings"
+            fetch=self.row_values,
+            on_select=self.on_select
         )
+        self.tree = self.table.tree
         
         # Calculate relative column widths
         total_width = self.window_width - 100
@@ -192,22 +294,23 @@ class WatchPricingApp:
         self.tree.column("Service", width=int(total_width * 0.2))
         self.tree.column("Date", width=int(total_width * 0.2))
 
-        # Configure headings
-        for col in ("Brand", "Price", "Category", "Service", "Date"):
-            self.tree.heading(col, text=col)
-
-        # Bind select event
-        self.tree.bind('<<TreeviewSelect>>', self.on_select)
+        # Configure headings; clicking one sorts by that column
+        for col in COLUMNS:
+            self.tree.heading(col, text=col, command=lambda c=col: self.sort_by(c))
 
-        # Scrollbars
-        y_scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        y_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        # Scrollbars; the vertical one scrolls the store-backed rows
+        self.table.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
         x_scrollbar = ttk.Scrollbar(tree_frame, orient=tk.HORIZONTAL, command=self.tree.xview)
         x_scrollbar.pack(side=tk.BOTTOM, fill=tk.X)
         
-        self.tree.configure(yscrollcommand=y_scrollbar.set, xscrollcommand=x_scrollbar.set)
+        self.tree.configure(xscrollcommand=x_scrollbar.set)
         self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        # Status bar showing the background save state
+        self.status_label = ttk.Label(main_container, text="", anchor=tk.W)
+        self.status_label.pack(side=tk.BOTTOM, fill=tk.X, pady=(5, 0))
+
         # Add Footer at the bottom
         footer_frame = ttk.Frame(main_container)
         footer_frame.pack(side=tk.BOTTOM, pady=(10, 0))
@@ -244,20 +347,27 @@ class WatchPricingApp:
         entry.focus()
 
         def save_category():
+            # Saved to the catalog for the selected service type
+            service_type = self.service_type.get()
             new_category = entry.get().strip()
-            if new_category:
-                current_categories = list(self.category_type['values'])
-                if not current_categories or new_category not in current_categories:
-                    new_categories = list(current_categories) if current_categories else []
-                    new_categories.append(new_category)
-                    self.category_type['values'] = new_categories
-                    self.category_type.set(new_category)
-                    dialog.destroy()
-                    messagebox.showinfo("Success", f"Added new category: {new_category}")
-                else:
-                    messagebox.showwarning("Warning", "Category already exists!")
-            else:
-                messagebox.showwarning("Warning", "Please enter a category name")
+            try:
+                self.catalog.add_category(service_type, new_category)
+            except ValueError as e:
+                messagebox.showwarning("Warning", str(e))
+                return
+            except OSError as e:
+                messagebox.showerror("Error", f"Could not save the category: {str(e)}")
+                return
+            self.update_categories(None)
+            self.category_type.set(new_category)
+            self.service.undo.push_action(
+                f"Add category {new_category}",
+                lambda: self.change_catalog(self.catalog.remove_category, service_type, new_category),
+                lambda: self.change_catalog(self.catalog.add_category, service_type, new_category)
+            )
+            self.update_undo_buttons()
+            dialog.destroy()
+            messagebox.showinfo("Success", f"Added new category: {new_category}")
 
         # Add buttons
         button_frame = ttk.Frame(dialog)
@@ -265,38 +375,197 @@ class WatchPricingApp:
         ttk.Button(button_frame, text="Save", command=save_category).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Cancel", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
 
+    def add_new_service(self):
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Add Service Type")
+        dialog.geometry("350x200")
+        dialog.transient(self.root)
+        dialog.grab_set()
+
+        ttk.Label(dialog, text="Enter new service type name:").pack(pady=(10, 5))
+        name_entry = ttk.Entry(dialog, width=40)
+        name_entry.pack(pady=5, padx=10)
+        name_entry.focus()
+        ttk.Label(dialog, text="Categories (comma separated):").pack(pady=(10, 5))
+        categories_entry = ttk.Entry(dialog, width=40)
+        categories_entry.pack(pady=5, padx=10)
+
+        def save_service():
+            service_type = name_entry.get().strip()
+            categories = [name.strip() for name in categories_entry.get().split(",") if name.strip()]
+            try:
+                self.catalog.add_service(service_type, categories)
+            except ValueError as e:
+                messagebox.showwarning("Warning", str(e))
+                return
+            except OSError as e:
+                messagebox.showerror("Error", f"Could not save the service type: {str(e)}")
+                return
+            self.refresh_services()
+            self.service_type.set(service_type)
+            self.update_categories(None)
+            self.service.undo.push_action(
+                f"Add service type {service_type}",
+                lambda: self.change_catalog(self.catalog.remove_service, service_type),
+                lambda: self.change_catalog(self.catalog.add_service, service_type, categories)
+            )
+            self.update_undo_buttons()
+            dialog.destroy()
+            messagebox.showinfo("Success", f"Added new service type: {service_type}")
+
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(pady=10)
+        ttk.Button(button_frame, text="Save", command=save_service).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Cancel", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
+
+    def change_catalog(self, change, *args):
+        # Undo/redo of catalog edits; the form follows along
+        change(*args)
+        self.refresh_services()
+        if self.service_type.get() not in self.catalog.services():
+            self.service_type.set(self.default_service())
+        self.update_categories(None)
+
+    def merge_catalog(self):
+        # Offer the categories the loaded entries use even when the catalog
+        # lacks them; the summary already groups entries by both
+        try:
+            changed = self.catalog.merge(self.summary.groups)
+        except OSError:
+            changed = True  # Kept in memory; saved with the next catalog change
+        if changed:
+            self.refresh_services()
+            # Keep the current choice; only the lists grow
+            self.category_type['values'] = self.catalog.categories(self.service_type.get())
+
+    def refresh_services(self):
+        self.service_type['values'] = self.catalog.services()
+        self.search_service['values'] = ["All"] + self.catalog.services()
+
+    def default_service(self):
+        services = self.catalog.services()
+        return services[0] if services else ""
+
     def update_categories(self, event):
-        service = self.service_type.get()
-        current_categories = list(self.category_type['values']) if self.category_type['values'] else []
-        
-        if service == "5 Year Battery":
-            default_categories = ["Category 1", "Category 2", "Category 3", "Category 4", "Category 5"]
-        elif service == "Lifetime Battery":
-            default_categories = ["Category 1", "Category 2", "Category 3", "Category 4", "Category 5"]
-        elif service == "Band Adjustment":
-            default_categories = ["Basic", "Mid-Range", "High-End"]
-        else:  # Overhaul
-            default_categories = ["Basic Service", "Full Service", "Complete Restoration"]
-
-        # Combine default categories with any custom categories
-        all_categories = list(set(default_categories + current_categories))
-        all_categories.sort()
-        
-        self.category_type['values'] = all_categories
-        if all_categories:
-            self.category_type.set(all_categories[0])
-
-    def check_duplicate(self, brand, service_type, current_date=None):
-        # Get all items from treeview
-        for item in self.tree.get_children():
-            values = self.tree.item(item)['values']
-            # If updating, ignore the current entry being updated
-            if current_date and values[4] == current_date:
-                continue
-            # Check if brand and service type match
-            if values[0].lower() == brand.lower() and values[3] == service_type:
-                return True
-        return False
+        categories = self.catalog.categories(self.service_type.get())
+        self.category_type['values'] = categories
+        self.category_type.set(categories[0] if categories else "")
+
+    def check_duplicate(self, brand, service_type, current_id=None):
+        # If updating, the current entry being updated is ignored
+        return self.service.check_duplicate(brand, service_type, current_id)
+
+    def show_duplicates(self):
+        groups = self.store.duplicate_groups()
+        if not groups:
+            messagebox.showinfo("Duplicates", "No duplicate entries found")
+            return
+        lines = [
+            f"{brand} - {service_type}: {count} entries"
+            for (brand, service_type), count in sorted(groups.items(), key=lambda g: (str(g[0][0]).lower(), g[0][1]))
+        ]
+        messagebox.showinfo("Duplicates", "\n".join(lines))
+
+    def show_history(self):
+        if not self.selected_item:
+            messagebox.showwarning("Warning", "Please select an item to see its price history")
+            return
+        row = self.store.get(self.selected_item)
+        brand, service_type = row[0], row[3]
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"Price History - {brand} ({service_type})")
+        dialog.geometry("600x350")
+        dialog.transient(self.root)
+
+        ttk.Label(dialog, text=self.service.trend(brand, service_type).summary()).pack(fill=tk.X, padx=10, pady=10)
+        columns = ("Changed", "Change", "Price", "Category")
+        tree = ttk.Treeview(dialog, columns=columns, show="headings")
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=140)
+        scrollbar = ttk.Scrollbar(dialog, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y, padx=(0, 10), pady=(0, 10))
+        tree.pack(fill=tk.BOTH, expand=True, padx=(10, 0), pady=(0, 10))
+        # Newest first
+        for changed, action, _, _, price, category, _, _ in reversed(self.service.history(brand, service_type)):
+            tree.insert("", tk.END, values=(changed.strftime("%Y-%m-%d %H:%M"), action.capitalize(), f"${price:g}", category))
+
+    def show_summary(self):
+        if self.summary_window is not None:
+            self.summary_window.lift()
+            return
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Summary")
+        dialog.geometry("800x400")
+        self.summary_window = dialog
+
+        columns = ("Entries", "Brands", "Average", "Median", "Min", "Max", "Total")
+        tree = ttk.Treeview(dialog, columns=columns)
+        tree.heading("#0", text="Group")
+        tree.column("#0", width=200)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=80, anchor=tk.E)
+        scrollbar = ttk.Scrollbar(dialog, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        tree.pack(fill=tk.BOTH, expand=True)
+        tree.insert("", tk.END, iid="all", text="All entries", open=True)
+        tree.insert("", tk.END, iid="services", text="By service type", open=True)
+        tree.insert("", tk.END, iid="categories", text="By category", open=True)
+
+        def close():
+            self.summary_window = None
+            dialog.destroy()
+
+        dialog.protocol("WM_DELETE_WINDOW", close)
+        self.refresh_summary(tree, None)
+
+    def refresh_summary(self, tree, version):
+        # Redraws from the maintained aggregates whenever they have changed;
+        # items keep their iids so expanded groups stay expanded
+        if self.summary_window is None:
+            return
+        if version != self.summary.version:
+            version = self.summary.version
+
+            def money(value):
+                return f"${value:,.2f}" if value is not None else ""
+
+            def values(aggregate):
+                return (aggregate.count, len(aggregate.brands), money(aggregate.mean()), money(aggregate.median()),
+                        money(aggregate.min()), money(aggregate.max()), money(aggregate.sum()))
+
+            # iid -> (depth, parent, text, aggregate); parents are placed first
+            wanted = {"all": (0, "", "All entries", self.summary.overall)}
+            for service_type, aggregate in self.summary.services.items():
+                wanted[f"service:{service_type}"] = (1, "services", service_type, aggregate)
+            for (service_type, category), aggregate in self.summary.groups.items():
+                wanted[f"group:{service_type}:{category}"] = (2, f"service:{service_type}", category, aggregate)
+            for category, aggregate in self.summary.categories.items():
+                wanted[f"category:{category}"] = (1, "categories", category, aggregate)
+
+            for parent in ("services", "categories"):
+                for iid in tree.get_children(parent):
+                    for child in tree.get_children(iid):
+                        if child not in wanted:
+                            tree.delete(child)
+                    if iid not in wanted:
+                        tree.delete(iid)
+            for iid, (_, parent, text, aggregate) in sorted(wanted.items(), key=lambda item: item[1][0]):
+                if tree.exists(iid):
+                    tree.item(iid, values=values(aggregate))
+                else:
+                    tree.insert(parent, self.summary_position(tree, parent, text), iid=iid, text=text,
+                                values=values(aggregate))
+        self.root.after(500, self.refresh_summary, tree, version)
+
+    def summary_position(self, tree, parent, text):
+        # Keeps each level in alphabetical order as groups appear
+        siblings = [tree.item(iid, "text") for iid in tree.get_children(parent)]
+        return sum(1 for sibling in siblings if str(sibling).casefold() < str(text).casefold())
 
     def add_entry(self):
         try:
@@ -305,38 +574,23 @@ class WatchPricingApp:
             service_type = self.service_type.get()
             category = self.category_type.get()
 
-            if not brand or not price or not category:
-                messagebox.showerror("Error", "Please fill in all fields")
-                return
-
+            # Add to the store; the workbook is saved in the background
             try:
-                price_float = float(price)
-                if price_float <= 0:
-                    messagebox.showerror("Error", "Price must be greater than 0")
-                    return
-            except ValueError:
-                messagebox.showerror("Error", "Invalid price format")
-                return
-
-            # Check for duplicates
-            if self.check_duplicate(brand, service_type):
+                record_id = self.service.add(brand, price, category, service_type)
+            except DuplicateEntryError:
                 response = messagebox.askyesno(
                     "Duplicate Entry",
                     f"A record for {brand} with {service_type} already exists.\nDo you want to add it anyway?"
                 )
                 if not response:
                     return
+                record_id = self.service.add(brand, price, category, service_type, allow_duplicate=True)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
 
-            date_added = datetime.now().strftime("%Y-%m-%d %H:%M")
-
-            # Add to treeview
-            self.tree.insert("", 0, values=(brand, f"${price}", category, service_type, date_added))
-
-            # Add to Excel
-            wb = openpyxl.load_workbook(self.excel_file)
-            sheet = wb.active
-            sheet.append([brand, float(price), category, service_type, date_added])
-            wb.save(self.excel_file)
+            # Add to the top of the table, keyed by the record ID
+            self.record_added(record_id)
 
             # Clear entries
             self.brand_entry.delete(0, tk.END)
@@ -348,21 +602,159 @@ class WatchPricingApp:
         except Exception as e:
             messagebox.showerror("Error", f"An error occurred: {str(e)}")
 
-    def on_select(self, event):
-        selected_items = self.tree.selection()
-        if selected_items:
-            self.selected_item = selected_items[0]
-            values = self.tree.item(self.selected_item)['values']
-            self.brand_entry.delete(0, tk.END)
-            self.brand_entry.insert(0, values[0])
-            self.price_entry.delete(0, tk.END)
-            self.price_entry.insert(0, values[1].replace('$', ''))
-            self.service_type.set(values[3])
-            # Update categories and set the selected category
-            self.update_categories(None)
-            self.category_type.set(values[2])
+    def record_added(self, record_id):
+        row = self.store.get(record_id)
+        self.search_index.add(row, record_id)
+        self.sort_cache.add(row, record_id)
+        self.summary.add(row, record_id)
+        self.view_ids.insert(self.view_position(self.view_ids, record_id), record_id)
+        if self.query is None or self.search_index.matches(record_id, self.query):
+            self.table.insert(self.view_position(self.table.ids, record_id), record_id)
+
+    def record_updated(self, record_id):
+        row = self.store.get(record_id)
+        self.search_index.update(row, record_id)
+        self.sort_cache.update(row, record_id)
+        self.summary.update(row, record_id)
+        shown = record_id in self.table.ids
+        matches = self.query is None or self.search_index.matches(record_id, self.query)
+        if self.sort_column is not None:
+            # The edit may have moved the record within the sort order
+            self.view_ids.remove(record_id)
+            self.view_ids.insert(self.view_position(self.view_ids, record_id), record_id)
+        if shown and (not matches or self.sort_column is not None):
+            self.table.remove(record_id)
+            shown = False
+        if matches and not shown:
+            self.table.insert(self.view_position(self.table.ids, record_id), record_id)
+        elif shown:
+            self.table.refresh()
+
+    def record_removed(self, record_id):
+        self.view_ids.remove(record_id)
+        self.search_index.remove(record_id)
+        self.sort_cache.remove(record_id)
+        self.summary.remove(record_id)
+        if record_id in self.table.ids:
+            self.table.remove(record_id)
+
+    def records_changed(self, added=(), updated=(), removed=()):
+        # Bulk version of record_added/record_updated/record_removed: update
+        # the indexes, then rebuild the view once instead of redrawing per record
+        if removed:
+            doomed = set(removed)
+            for record_id in doomed:
+                self.search_index.remove(record_id)
+                self.sort_cache.remove(record_id)
+                self.summary.remove(record_id)
+            self.view_ids = [record_id for record_id in self.view_ids if record_id not in doomed]
+        for record_id in updated:
+            row = self.store.get(record_id)
+            self.search_index.update(row, record_id)
+            self.sort_cache.update(row, record_id)
+            self.summary.update(row, record_id)
+        for record_id in added:
+            row = self.store.get(record_id)
+            self.search_index.add(row, record_id)
+            self.sort_cache.add(row, record_id)
+            self.summary.add(row, record_id)
+        if self.sort_column is not None:
+            self.view_ids = self.sort_cache.order(self.sort_column, self.sort_descending)
         else:
-            self.selected_item = None
+            self.view_ids[:0] = reversed(added)
+        self.show_view(keep_offset=True)
+
+    def view_position(self, record_ids, record_id):
+        # New entries go on top unless the view is sorted
+        if self.sort_column is None:
+            return 0
+        return self.sort_cache.insert_position(record_ids, record_id, self.sort_column, self.sort_descending)
+
+    def sort_by(self, column_name):
+        column = COLUMNS.index(column_name)
+        if column == self.sort_column:
+            # Same column again: flip direction by reversing the current order
+            self.sort_descending = not self.sort_descending
+            self.view_ids.reverse()
+            self.table.set_ids(self.table.ids[::-1])
+        else:
+            self.sort_column = column
+            self.sort_descending = False
+            self.view_ids = self.sort_cache.order(column)
+            self.show_view()
+
+        for index, col in enumerate(COLUMNS):
+            arrow = ""
+            if index == self.sort_column:
+                arrow = " \u25bc" if self.sort_descending else " \u25b2"
+            self.tree.heading(col, text=col + arrow)
+
+    def show_view(self, keep_offset=False):
+        # Redisplay view_ids, keeping whatever filter is active
+        if self.query is None:
+            self.table.set_ids(self.view_ids, keep_offset)
+        else:
+            self.table.set_ids(self.search_index.filter(self.view_ids, self.query), keep_offset)
+
+    def current_query(self):
+        service = self.search_service.get()
+        return SearchQuery(
+            text=self.search_text.get(),
+            service="" if service == "All" else service,
+            category=self.search_category.get().strip(),
+            min_price=parse_price(self.search_min_price.get()),
+            max_price=parse_price(self.search_max_price.get()),
+            date_from=self.search_date_from.get().strip(),
+            date_to=self.search_date_to.get().strip()
+        )
+
+    def apply_filter(self, *args):
+        query = self.current_query()
+        if query.is_empty():
+            self.query = None
+            self.table.set_ids(self.view_ids)
+            return
+
+        if query.narrows(self.query):
+            # The user narrowed the query; filter what is already shown
+            record_ids = self.search_index.filter(self.table.ids, query)
+        else:
+            matches = self.search_index.search(query)
+            record_ids = [record_id for record_id in self.view_ids if record_id in matches]
+        self.query = query
+        self.table.set_ids(record_ids)
+
+    def clear_filter(self):
+        for var in (self.search_text, self.search_category, self.search_min_price,
+                    self.search_max_price, self.search_date_from, self.search_date_to):
+            var.set("")
+        self.search_service.set("All")
+        self.apply_filter()
+
+    def refresh_search_categories(self):
+        self.search_category_box['values'] = sorted(self.search_index.categories)
+
+    def row_values(self, record_id):
+        row = self.store.get(record_id)
+        return (
+            row[0],  # Brand
+            f"${row[1]}" if row[1] else "",  # Price
+            row[2] if row[2] else "",  # Category
+            row[3] if row[3] else "",  # Service Type
+            row[4] if row[4] else ""   # Date
+        )
+
+    def on_select(self, record_id):
+        self.selected_item = record_id
+        row = self.store.get(record_id)
+        self.brand_entry.delete(0, tk.END)
+        self.brand_entry.insert(0, row[0])
+        self.price_entry.delete(0, tk.END)
+        self.price_entry.insert(0, row[1] if row[1] is not None else "")
+        self.service_type.set(row[3])
+        # Update categories and set the selected category
+        self.update_categories(None)
+        self.category_type.set(row[2])
     def update_entry(self):
         if not self.selected_item:
             messagebox.showwarning("Warning", "Please select an item to update")
@@ -373,56 +765,28 @@ class WatchPricingApp:
             price = self.price_entry.get().strip()
             service_type = self.service_type.get()
             category = self.category_type.get()
-            current_values = self.tree.item(self.selected_item)['values']
-
-            if not brand or not price or not category:
-                messagebox.showerror("Error", "Please fill in all fields")
-                return
-
+            # Update the store, then redraw the visible rows from it; the
+            # service only checks duplicates if brand or service type changed
             try:
-                price_float = float(price)
-                if price_float <= 0:
-                    messagebox.showerror("Error", "Price must be greater than 0")
+                self.service.update(self.selected_item, brand, price, category, service_type)
+            except DuplicateEntryError:
+                response = messagebox.askyesno(
+                    "Duplicate Entry",
+                    f"A record for {brand} with {service_type} already exists.\nDo you want to update anyway?"
+                )
+                if not response:
                     return
-            except ValueError:
-                messagebox.showerror("Error", "Invalid price format")
+                self.service.update(self.selected_item, brand, price, category, service_type, allow_duplicate=True)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
                 return
-
-            # Check for duplicates if brand or service type changed
-            if (brand.lower() != current_values[0].lower() or 
-                service_type != current_values[3]):
-                if self.check_duplicate(brand, service_type, current_values[4]):
-                    response = messagebox.askyesno(
-                        "Duplicate Entry",
-                        f"A record for {brand} with {service_type} already exists.\nDo you want to update anyway?"
-                    )
-                    if not response:
-                        return
-
-            date_added = current_values[4]
-
-            # Update treeview
-            self.tree.item(self.selected_item, values=(brand, f"${price}", category, service_type, date_added))
-
-            # Update Excel file
-            wb = openpyxl.load_workbook(self.excel_file)
-            sheet = wb.active
-            
-            for row in sheet.iter_rows(min_row=2):
-                if (row[0].value == current_values[0] and 
-                    row[4].value == current_values[4]):
-                    row[0].value = brand
-                    row[1].value = float(price)
-                    row[2].value = category
-                    row[3].value = service_type
-                    break
-            
-            wb.save(self.excel_file)
+            self.table.clear_selection()
+            self.record_updated(self.selected_item)
 
             # Clear entries
             self.brand_entry.delete(0, tk.END)
             self.price_entry.delete(0, tk.END)
-            self.service_type.set("5 Year Battery")
+            self.service_type.set(self.default_service())
             self.selected_item = None
 
             messagebox.showinfo("Success", f"Updated {brand}")
@@ -439,28 +803,14 @@ class WatchPricingApp:
             return
 
         try:
-            values = self.tree.item(self.selected_item)['values']
-            
-            # Remove from treeview
-            self.tree.delete(self.selected_item)
-
-            # Remove from Excel file
-            wb = openpyxl.load_workbook(self.excel_file)
-            sheet = wb.active
-            
-            # Find and remove the row in Excel
-            for row_idx, row in enumerate(sheet.iter_rows(min_row=2), start=2):
-                if (row[0].value == values[0] and 
-                    row[4].value == values[4]):  # Match brand and date to identify unique row
-                    sheet.delete_rows(row_idx)
-                    break
-            
-            wb.save(self.excel_file)
+            # Remove from the table and the store
+            self.record_removed(self.selected_item)
+            self.service.remove(self.selected_item)
 
             # Clear entries
             self.brand_entry.delete(0, tk.END)
             self.price_entry.delete(0, tk.END)
-            self.service_type.set("5 Year Battery")
+            self.service_type.set(self.default_service())
             self.selected_item = None
 
             messagebox.showinfo("Success", "Entry removed successfully")
@@ -485,17 +835,280 @@ class WatchPricingApp:
 
     def load_existing_data(self):
         if os.path.exists(self.excel_file):
-            wb = openpyxl.load_workbook(self.excel_file)
-            sheet = wb.active
-            for row in sheet.iter_rows(min_row=2, values_only=True):
-                if row[0] and len(row) >= 5:  # Ensure row has all required fields
-                    self.tree.insert("", 0, values=(
-                        row[0],  # Brand
-                        f"${row[1]}" if row[1] else "",  # Price
-                        row[2] if row[2] else "",  # Category
-                        row[3] if row[3] else "",  # Service Type
-                        row[4] if row[4] else ""   # Date
-                    ))
+            # Read the workbook on a worker thread; batches are added to the
+            # tree from the Tk thread so the window is usable straight away
+            self.load_queue = queue.Queue()
+            self.loaded_rows = 0
+            self.loaded_ids = set()
+            self.load_frame.pack(side=tk.TOP, fill=tk.X, pady=(0, 5), before=self.table.scrollbar)
+            threading.Thread(target=self.load_worker, daemon=True).start()
+            self.root.after(50, self.drain_load_queue)
+
+    def load_worker(self):
+        try:
+            self.store.load(on_batch=lambda rows, total: self.load_queue.put((rows, total)))
+            self.load_queue.put(None)
+        except Exception as e:
+            self.load_queue.put(e)
+
+    def drain_load_queue(self):
+        # Insert at most one batch per tick to keep the UI responsive
+        try:
+            batch = self.load_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(50, self.drain_load_queue)
+            return
+
+        if batch is None:
+            self.loaded_ids = set()
+            self.load_frame.pack_forget()
+            self.merge_catalog()
+            return
+        if isinstance(batch, Exception):
+            # Only part of the file is in memory; close rather than let an
+            # edit save that part over the whole file (the store refuses to)
+            self.load_frame.pack_forget()
+            messagebox.showerror(
+                "Error",
+                f"Could not load entries: {str(batch)}\n\n" +
+                "The price list will close without saving, so the file is left as it was."
+            )
+            self.root.destroy()
+            return
+
+        rows, total = batch
+        record_ids = []
+        self.search_index.add_many((row, row[ID_COLUMN]) for row in rows)
+        self.summary.add_many((row, row[ID_COLUMN]) for row in rows)
+        for row in rows:
+            self.sort_cache.add(row, row[ID_COLUMN])
+            record_ids.append(row[ID_COLUMN])
+        self.loaded_ids.update(record_ids)
+        if self.sort_column is not None:
+            # Sorted before the load finished; take the maintained order
+            self.view_ids = self.sort_cache.order(self.sort_column, self.sort_descending)
+            self.show_view(keep_offset=True)
+        else:
+            # The file lists the oldest entries first; each batch goes above
+            # the ones before it, below anything added while loading
+            record_ids.reverse()
+            position = self.load_position(self.view_ids)
+            self.view_ids[position:position] = record_ids
+            if self.query is not None:
+                record_ids = self.search_index.filter(record_ids, self.query)
+            self.table.insert_many(self.load_position(self.table.ids), record_ids)
+        self.loaded_rows += len(rows)
+        if total:
+            self.load_progress['value'] = min(100, self.loaded_rows * 100 / total)
+        else:
+            # Sheet dimensions not recorded; just show activity
+            self.load_progress.configure(mode="indeterminate")
+            self.load_progress.step(10)
+        self.load_label.configure(text=f"Loading entries... {self.loaded_rows}")
+        self.root.after(1, self.drain_load_queue)
+
+    def load_position(self, record_ids):
+        # Where the next loaded batch goes: after the entries added since the
+        # load started, which are on top
+        position = 0
+        while position < len(record_ids) and record_ids[position] not in self.loaded_ids:
+            position += 1
+        return position
+
+    def import_price_list(self):
+        file_path = filedialog.askopenfilename(
+            title="Import Price List",
+            filetypes=[("Price lists", "*.csv *.xlsx"), ("CSV files", "*.csv"), ("Excel files", "*.xlsx")],
+            initialdir=os.path.expanduser("~/Documents")
+        )
+        if not file_path:
+            return
+        try:
+            plan = self.service.plan_import(file_path)
+            if not plan.inserts and not plan.conflicts:
+                messagebox.showwarning("Import", "Nothing to import.\n\n" + plan.summary())
+                return
+            response = messagebox.askyesnocancel(
+                "Import Price List",
+                plan.summary() + "\n\nUpdate the prices of entries already in the list?\n\n" +
+                "Click 'Yes' to update them\n" +
+                "Click 'No' to only add new entries"
+            )
+            if response is None:
+                return
+
+            new_ids, updated_ids = self.service.apply_import(plan, update_conflicts=response)
+            self.records_changed(added=new_ids, updated=updated_ids)
+            messagebox.showinfo("Success", f"Added {len(new_ids)} and updated {len(updated_ids)} entries")
+        except Exception as e:
+            messagebox.showerror("Error", f"An error occurred: {str(e)}")
+
+    def bulk_reprice(self):
+        # Applies rules to every entry currently shown, i.e. the search results
+        record_ids = list(self.table.ids)
+        if not record_ids:
+            messagebox.showwarning("Warning", "No entries to reprice; adjust the search first")
+            return
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Bulk Reprice")
+        dialog.geometry("700x450")
+        dialog.transient(self.root)
+        dialog.grab_set()
+
+        ttk.Label(dialog, text=f"Reprice the {len(record_ids)} entries shown. Rules, comma separated, e.g. "
+                               "+8%, floor 25, round .99").pack(fill=tk.X, padx=10, pady=(10, 5))
+        rules = tk.StringVar()
+        rules_entry = ttk.Entry(dialog, textvariable=rules)
+        rules_entry.pack(fill=tk.X, padx=10)
+        rules_entry.focus()
+        summary_label = ttk.Label(dialog, text="", justify=tk.LEFT)
+        summary_label.pack(fill=tk.X, padx=10, pady=5)
+
+        columns = ("Brand", "Service", "Category", "Old Price", "New Price")
+        preview = ttk.Treeview(dialog, columns=columns, show="headings", height=10)
+        for col in columns:
+            preview.heading(col, text=col)
+            preview.column(col, width=120)
+        preview.pack(fill=tk.BOTH, expand=True, padx=10)
+        plan = {}
+
+        def show_preview():
+            try:
+                plan["current"] = self.service.plan_repricing(record_ids, rules.get().split(","))
+            except ValueError as e:
+                messagebox.showerror("Error", str(e), parent=dialog)
+                return
+            preview.delete(*preview.get_children())
+            for record_id, old, new in plan["current"].changes:
+                row = self.store.get(record_id)
+                preview.insert("", tk.END, values=(row[0], row[3], row[2], f"${old:g}", f"${new:g}"))
+            summary_label.configure(text=plan["current"].summary())
+
+        def apply():
+            if "current" not in plan:
+                show_preview()
+                if "current" not in plan:
+                    return
+            try:
+                updated_ids = self.service.apply_repricing(plan["current"])
+            except Exception as e:
+                messagebox.showerror("Error", f"An error occurred: {str(e)}", parent=dialog)
+                return
+            self.records_changed(updated=updated_ids)
+            dialog.destroy()
+            messagebox.showinfo("Success", f"Repriced {len(updated_ids)} entries")
+
+        # Typing new rules invalidates the preview
+        rules.trace_add("write", lambda *args: plan.pop("current", None))
+        rules_entry.bind("<Return>", lambda event: show_preview())
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(pady=10)
+        ttk.Button(button_frame, text="Preview", command=show_preview).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Apply", command=apply).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Cancel", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
+
+    def undo(self):
+        self.apply_undo(self.service.undo.undo())
+
+    def redo(self):
+        self.apply_undo(self.service.undo.redo())
+
+    def apply_undo(self, result):
+        added, updated, removed = result
+        if self.selected_item in removed:
+            self.selected_item = None
+        if added or updated or removed:
+            self.records_changed(added=added, updated=updated, removed=removed)
+        self.update_undo_buttons()
+
+    def update_undo_buttons(self):
+        # The buttons name the step they would undo or redo
+        for button, text, label in ((self.undo_button, "Undo", self.service.undo.undo_label()),
+                                    (self.redo_button, "Redo", self.service.undo.redo_label())):
+            if label is None:
+                button.configure(text=text, state=tk.DISABLED)
+            else:
+                if len(label) > 24:
+                    label = label[:23] + "\u2026"
+                button.configure(text=f"{text} {label}", state=tk.NORMAL)
+
+    def export_to_excel(self):
+        file_path = filedialog.asksaveasfilename(
+            title="Export Price List",
+            defaultextension=".xlsx",
+            filetypes=[("Excel files", "*.xlsx")],
+            initialdir=os.path.dirname(os.path.abspath(self.excel_file)),
+            initialfile=os.path.splitext(os.path.basename(self.excel_file))[0] + " Export.xlsx"
+        )
+        if not file_path:
+            return
+        try:
+            self.service.export(file_path)
+            messagebox.showinfo("Success", f"Exported {len(self.store.rows)} entries to {file_path}")
+        except Exception as e:
+            messagebox.showerror("Error", f"An error occurred: {str(e)}")
+
+    def poll_save_status(self):
+        # Saves run on the store's writer thread; read its status from here
+        self.update_undo_buttons()
+        state, message = self.store.status
+        if state == "failed":
+            self.status_label.configure(text=f"Save failed: {message}", foreground="red")
+        else:
+            text = {"saved": "All changes saved", "pending": "Unsaved changes", "saving": "Saving\u2026"}[state]
+            if self.overwritten:
+                text += f" \u2014 {self.overwritten} of your edits replaced changes someone else made at the same time"
+            self.status_label.configure(text=text, foreground="")
+        self.root.after(250, self.poll_save_status)
+
+    def poll_remote_changes(self):
+        # Picks up entries saved by other copies of the app sharing the file.
+        # The file is re-read on a worker thread and only the rows that
+        # changed are applied here.
+        try:
+            changes = self.remote_queue.get_nowait()
+        except queue.Empty:
+            pass
+        else:
+            self.refreshing = False
+            # A failed read is simply tried again on the next poll
+            if not isinstance(changes, Exception):
+                self.apply_remote_changes(changes)
+        self.overwritten += len(self.store.take_conflicts())
+        if not self.refreshing and self.store.changed_externally():
+            self.refreshing = True
+            threading.Thread(target=self.remote_worker, daemon=True).start()
+        self.root.after(2000, self.poll_remote_changes)
+
+    def remote_worker(self):
+        try:
+            self.remote_queue.put(self.store.remote_changes())
+        except Exception as e:
+            self.remote_queue.put(e)
+
+    def apply_remote_changes(self, changes):
+        added, updated, removed = self.store.apply_remote(changes)
+        if not (added or updated or removed):
+            return
+        if self.selected_item in removed:
+            self.selected_item = None
+        self.records_changed(added=added, updated=updated, removed=removed)
+        # Undo steps for those entries are gone
+        self.update_undo_buttons()
+
+    def on_close(self):
+        # Write out any pending changes before the window goes away
+        try:
+            self.service.close()
+        except Exception as e:
+            if not messagebox.askyesno(
+                "Save Failed",
+                f"Could not save changes: {str(e)}\nSaving will keep retrying in the background.\n\n" +
+                "Close anyway and lose unsaved changes?"
+            ):
+                return
+        self.root.destroy()
 
 def main():
     root = tk.Tk()
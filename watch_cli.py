@@ -0,0 +1,176 @@
+import argparse
+import csv
+import sys
+
+from price_service import DuplicateEntryError, PriceService
+from repricing import RULE_HELP
+from search_index import SearchQuery
+
+# Headless front end for scripted price updates. Nothing here imports
+# tkinter, so it runs on servers without a display and starts quickly.
+#
+#   python watch_cli.py add prices.xlsx --brand Seiko --price 25 \
+#       --category "Category 2" --service "5 Year Battery"
+#   python watch_cli.py query prices.xlsx --brand sei --max-price 30
+#   python watch_cli.py history prices.xlsx --brand Seiko --service "5 Year Battery"
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="watch_app", description="Watch Service Price Manager")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    file_arg = argparse.ArgumentParser(add_help=False)
+    file_arg.add_argument("file", help="price list (.xlsx workbook or .db SQLite database)")
+
+    filter_args = argparse.ArgumentParser(add_help=False)
+    filter_args.add_argument("--brand", default="", help="brand prefix (under 3 letters) or substring")
+    filter_args.add_argument("--service", default="", help="service type")
+    filter_args.add_argument("--category", default="")
+    filter_args.add_argument("--min-price", type=float)
+    filter_args.add_argument("--max-price", type=float)
+    filter_args.add_argument("--from", dest="date_from", default="", help="YYYY-MM-DD")
+    filter_args.add_argument("--to", dest="date_to", default="", help="YYYY-MM-DD")
+
+    add = commands.add_parser("add", parents=[file_arg], help="add an entry")
+    add.add_argument("--brand", required=True)
+    add.add_argument("--price", required=True)
+    add.add_argument("--category", required=True)
+    add.add_argument("--service", required=True, help="service type")
+    add.add_argument("--allow-duplicate", action="store_true")
+
+    update = commands.add_parser("update", parents=[file_arg], help="update an entry by ID")
+    update.add_argument("id")
+    update.add_argument("--brand")
+    update.add_argument("--price")
+    update.add_argument("--category")
+    update.add_argument("--service", help="service type")
+    update.add_argument("--allow-duplicate", action="store_true")
+
+    remove = commands.add_parser("remove", parents=[file_arg], help="remove an entry by ID")
+    remove.add_argument("id")
+
+    import_ = commands.add_parser("import", parents=[file_arg], help="import a CSV or XLSX price list")
+    import_.add_argument("source")
+    import_.add_argument("--skip-existing", action="store_true",
+                         help="only add new entries; leave existing prices alone")
+    import_.add_argument("--dry-run", action="store_true", help="show the summary without saving")
+
+    export = commands.add_parser("export", parents=[file_arg], help="export to a five-column workbook")
+    export.add_argument("target")
+
+    query = commands.add_parser("query", parents=[file_arg, filter_args], help="list matching entries")
+    query.add_argument("--as-of", help="the price list as it was on this date (YYYY-MM-DD[ HH:MM])")
+    query.add_argument("--csv", action="store_true", help="write CSV instead of tab-separated text")
+
+    reprice = commands.add_parser("reprice", parents=[file_arg, filter_args],
+                                  help="change the prices of all matching entries")
+    reprice.add_argument("rules", nargs="+",
+                         help=f"applied in order: {RULE_HELP}; put -- before the rules if one starts with -")
+    reprice.add_argument("--dry-run", action="store_true", help="show the changes without saving")
+
+    history = commands.add_parser("history", parents=[file_arg], help="price changes for a brand and service")
+    history.add_argument("--brand", required=True)
+    history.add_argument("--service", required=True, help="service type")
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    service = PriceService(args.file)
+    try:
+        # Only adding and importing may start a new price list, and commands
+        # that change nothing leave every file as it is
+        read_only = args.command in ("query", "export", "history") or getattr(args, "dry_run", False)
+        service.open(create=args.command in ("add", "import"), read_only=read_only)
+        return run(service, args)
+    except DuplicateEntryError as e:
+        print(f"error: {e} Use --allow-duplicate to save it anyway.", file=sys.stderr)
+        return 1
+    except KeyError as e:
+        print(f"error: {e.args[0]}", file=sys.stderr)
+        return 1
+    except (ValueError, OSError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        service.close()
+
+
+def run(service, args):
+    if args.command == "add":
+        record_id = service.add(args.brand, args.price, args.category, args.service,
+                                allow_duplicate=args.allow_duplicate)
+        print(record_id)
+
+    elif args.command == "update":
+        current = service.get(args.id)
+        service.update(
+            args.id,
+            args.brand if args.brand is not None else current[0],
+            args.price if args.price is not None else current[1],
+            args.category if args.category is not None else current[2],
+            args.service if args.service is not None else current[3],
+            allow_duplicate=args.allow_duplicate
+        )
+
+    elif args.command == "remove":
+        service.remove(args.id)
+
+    elif args.command == "import":
+        plan = service.plan_import(args.source)
+        print(plan.summary())
+        if not args.dry_run:
+            new_ids, updated_ids = service.apply_import(plan, update_conflicts=not args.skip_existing)
+            print(f"Added {len(new_ids)} and updated {len(updated_ids)} entries")
+
+    elif args.command == "export":
+        service.export(args.target)
+
+    elif args.command == "query":
+        rows = service.query(filter_query(args), as_of=args.as_of)
+        # ID first so the output can feed update/remove
+        if args.csv:
+            writer = csv.writer(sys.stdout)
+            writer.writerow(["ID", "Brand", "Price", "Category", "Service Type", "Date Added"])
+            for row in rows:
+                writer.writerow([row[5]] + row[:5])
+        else:
+            for row in rows:
+                print("\t".join(str(value) if value is not None else "" for value in [row[5]] + row[:5]))
+
+    elif args.command == "reprice":
+        plan = service.plan_repricing(service.select(filter_query(args)), args.rules)
+        for record_id, old, new in plan.changes:
+            row = service.get(record_id)
+            print(f"{record_id}\t{row[0]}\t{row[2]}\t{row[3]}\t${old:g} -> ${new:g}")
+        print(plan.summary())
+        if not args.dry_run:
+            service.apply_repricing(plan)
+
+    elif args.command == "history":
+        versions = service.history(args.brand, args.service)
+        if not versions:
+            raise ValueError(f"No entries for {args.brand} with {args.service}")
+        for changed, action, record_id, brand, price, category, service_type, _ in versions:
+            print("\t".join([changed.strftime("%Y-%m-%d %H:%M"), action, record_id, brand,
+                             f"{price:g}", category, service_type]))
+        print(service.trend(args.brand, args.service).summary())
+
+    return 0
+
+
+def filter_query(args):
+    return SearchQuery(
+        text=args.brand,
+        service=args.service,
+        category=args.category,
+        min_price=args.min_price,
+        max_price=args.max_price,
+        date_from=args.date_from,
+        date_to=args.date_to
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())